@@ -3,6 +3,7 @@ Production-ready configuration
 """
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
+from typing import Optional
 import os
 
 
@@ -18,6 +19,47 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    token_cache_max_size: int = 10000
+    token_cache_ttl_seconds: int = 300
+    ws_require_auth: bool = False
+    
+    # Password hashing (runs in a bounded thread pool off the event loop)
+    password_kdf: str = "scrypt"  # "scrypt" or "pbkdf2_sha256"
+    scrypt_n: int = 16384
+    scrypt_r: int = 8
+    scrypt_p: int = 1
+    pbkdf2_iterations: int = 600000
+    password_hash_workers: int = 4
+    password_hash_max_concurrency: int = 4
+    password_hash_queue_timeout_seconds: float = 5.0
+    
+    # Token revocation ("memory" or "redis" to share across workers)
+    revocation_backend: str = "memory"
+    revocation_bloom_filter: bool = False
+    revocation_sync_interval_seconds: float = 5.0
+    redis_url: Optional[str] = None
+    
+    # Rate limiting (token buckets; "redis" backend shares them across workers)
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"
+    rate_limit_per_minute: int = 600  # per IP, every /api request
+    auth_rate_limit_per_minute: int = 10  # per IP, login/register
+    pairing_rate_limit_per_minute: int = 10
+    command_rate_limit_per_minute: int = 20
+    upload_rate_limit_per_minute: int = 60
+    rate_limit_sweep_interval_seconds: float = 60.0
+    ws_message_rate_per_second: float = 50.0
+    ws_message_burst: int = 200
+    ws_rate_limit_max_violations: int = 500  # consecutive over-limit messages before closing
+    # Peers (IPs/CIDRs, or "*") whose X-Forwarded-For names the real client;
+    # set this to the load balancer's range when deployed behind one
+    trusted_proxies: list = ["127.0.0.1", "::1"]
+    
+    # Pairing codes and QR rendering
+    pairing_code_ttl_minutes: int = 10
+    pairing_max_codes: int = 100000
+    pairing_sweep_interval_seconds: float = 30.0
+    qr_render_workers: int = 2
     
     # CORS - Allow all for development, restrict in production
     allowed_origins: list = ["*"]
@@ -28,6 +70,56 @@ class Settings(BaseSettings):
     
     # File Storage
     file_storage_path: str = "./uploads"
+    max_file_size_mb: int = 10
+    upload_chunk_size_kb: int = 1024
+    upload_part_max_size_mb: int = 8
+    upload_max_parts: int = 10000
+    upload_session_ttl_minutes: int = 60
+    
+    # File delivery to desktops over WebSocket
+    file_transfer_chunk_kb: int = 64
+    file_transfer_window_kb: int = 1024
+    file_transfer_bandwidth_kbps: int = 0  # per device, 0 = unlimited
+    file_transfer_ack_timeout_seconds: float = 15.0
+    
+    # Audit Log
+    audit_log_path: str = "./audit_logs"
+    audit_segment_max_entries: int = 50000
+    audit_retention_days: int = 90
+    audit_max_segments: int = 200
+    audit_max_entries: int = 2000000  # caps the in-memory index (~40 bytes/entry)
+    audit_queue_max_size: int = 10000
+    audit_batch_size: int = 500
+    audit_flush_interval_seconds: float = 0.5
+    audit_retention_interval_seconds: float = 3600.0
+    
+    # Logging (queued, written by a background thread)
+    log_level: str = "INFO"
+    log_format: str = "json"  # "json" or "text"
+    log_queue_size: int = 10000
+    # Fraction of records kept per event, e.g. {"ws.message": 0.01}
+    log_sample_rates: dict = {"ws.message": 0.01}
+    # Max records per second per event
+    log_rate_limits: dict = {
+        "ws.connect": 20,
+        "ws.disconnect": 20,
+        "ws.relay_failed": 10,
+        "command.dispatch": 50,
+        "command.complete": 50,
+        "command.error": 20,
+        "command.undeliverable": 10,
+    }
+    
+    # Snapshots of the in-memory stores (restored on startup)
+    snapshot_enabled: bool = True
+    snapshot_path: str = "./snapshots/state.pickle"
+    snapshot_interval_seconds: float = 60.0
+    snapshot_fork: bool = True  # copy-on-write child process where os.fork exists
+    snapshot_fork_timeout_seconds: float = 120.0  # then kill the child and snapshot in-process
+    
+    # List responses with more rows than this are streamed instead of
+    # encoded into one buffer
+    json_stream_min_rows: int = 1000
     
     # Database (for future use)
     database_url: str = Field(default="sqlite:///./antigravity.db")
@@ -2,27 +2,185 @@
 Antigravity Link Backend - FastAPI Application
 Production-ready configuration for Railway deployment
 """
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.routers import auth, devices, commands, files, audit, websocket, projects
+from app.utils.security import revocation_store
+from app.utils import qr_generator
+from app.storage import (
+    users_db,
+    devices_db,
+    commands_db,
+    command_order,
+    pairing_codes,
+    restore_devices
+)
+from app.utils.snapshot import SnapshotManager
+from app.utils.metrics import CallbackMetric, MetricsMiddleware, render_metrics
+from app.utils.rate_limit import RateLimitMiddleware, create_rate_limiter, rate_limit_stats, sweep_rate_limiters
+from app.utils.log_pipeline import configure_logging, log_pipeline_stats
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Configure logging: records are queued and written by a background thread
+configure_logging(
+    level=settings.log_level,
+    fmt=settings.log_format,
+    queue_size=settings.log_queue_size,
+    sample_rates=settings.log_sample_rates,
+    rate_limits=settings.log_rate_limits
 )
 logger = logging.getLogger(__name__)
 
+snapshots = SnapshotManager(
+    settings.snapshot_path,
+    use_fork=settings.snapshot_fork,
+    fork_timeout=settings.snapshot_fork_timeout_seconds
+)
+
+
+def _replace(store: dict, state: dict):
+    store.clear()
+    store.update(state)
+
+
+def _restore_commands(state: dict):
+    _replace(commands_db, state)
+    # commands_db keeps insertion (= creation) order
+    command_order[:] = list(commands_db)
+
+
+def _restore_files(state: dict):
+    _replace(files.files_db, state)
+    files.blob_store.rebuild(files.files_db.values())
+
+
+# Registration order is restore order: files before the transfers that reference them.
+# Deliberately not snapshotted: upload sessions (clients start the upload
+# again; files.init_storage removes their leftover parts), the audit queue
+# (drained to the on-disk log at shutdown), rate-limit buckets, the
+# verified-token cache, and live WebSocket connections / pending desktop
+# requests.
+snapshots.register("users", lambda: users_db, lambda state: _replace(users_db, state))
+snapshots.register("revocations", revocation_store.entries, revocation_store.load)
+snapshots.register("devices", lambda: devices_db, restore_devices)
+snapshots.register("pairing_codes", pairing_codes.entries, pairing_codes.load)
+snapshots.register("commands", lambda: commands_db, _restore_commands)
+snapshots.register("files", lambda: files.files_db, _restore_files)
+snapshots.register(
+    "file_transfers",
+    websocket.file_transfers.export_queues,
+    lambda state: websocket.file_transfers.restore_queues(state, files.files_db.keys())
+)
+
+
+def _connection_counts() -> dict:
+    counts = {("mobile",): 0, ("desktop",): 0, ("other",): 0}
+    for device_id in list(websocket.active_connections):
+        kind = device_id.split("_")[1] if device_id.startswith("dev_") else "other"
+        key = (kind,) if (kind,) in counts else ("other",)
+        counts[key] += 1
+    return counts
+
+
+# Read at scrape time only
+CallbackMetric(
+    "antigravity_ws_connections", "Open WebSocket connections by device kind",
+    _connection_counts, ["kind"]
+)
+CallbackMetric(
+    "antigravity_pending_desktop_requests", "Desktop requests awaiting a response",
+    lambda: len(websocket.pending_requests)
+)
+CallbackMetric(
+    "antigravity_store_size", "Entries in each in-memory store",
+    lambda: {
+        ("users",): len(users_db),
+        ("devices",): len(devices_db),
+        ("pairing_codes",): len(pairing_codes),
+        ("commands",): len(commands_db),
+        ("files",): len(files.files_db),
+        ("upload_sessions",): len(files.upload_sessions),
+    },
+    ["store"]
+)
+CallbackMetric(
+    "antigravity_file_transfers_queued", "File pushes waiting for or in delivery",
+    lambda: websocket.file_transfers.stats()["queued_transfers"]
+)
+CallbackMetric(
+    "antigravity_file_transfer_bytes_total", "Bytes pushed to desktops",
+    lambda: websocket.file_transfers.stats()["bytes_sent"], type="counter"
+)
+CallbackMetric(
+    "antigravity_audit_queue_depth", "Audit events waiting to be written",
+    lambda: audit.audit_writer.stats()["queued"]
+)
+CallbackMetric(
+    "antigravity_audit_dropped_total", "Audit events dropped because the queue was full",
+    lambda: audit.audit_writer.stats()["dropped"], type="counter"
+)
+CallbackMetric(
+    "antigravity_log_records_dropped_total", "Log records dropped because the log queue was full",
+    lambda: log_pipeline_stats().get("dropped", 0), type="counter"
+)
+CallbackMetric(
+    "antigravity_rate_limited_total", "Requests rejected by each rate limiter",
+    lambda: {(name,): stats["limited"] for name, stats in rate_limit_stats().items()},
+    ["limiter"], type="counter"
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up storage, restore state and start background workers"""
+    await asyncio.to_thread(files.init_storage)
+    if settings.snapshot_enabled:
+        await asyncio.to_thread(snapshots.restore)
+    # Blobs uploaded after the last snapshot have no files_db entry any more
+    orphaned = await asyncio.to_thread(files.blob_store.sweep)
+    if orphaned:
+        logger.info("Removed %d unreferenced blobs", orphaned)
+    # Index the audit segments before reporting ready, not on the first query
+    await asyncio.to_thread(audit.audit_logs.load)
+    audit.audit_writer.start()
+    background_tasks = [
+        asyncio.create_task(files.sweep_upload_sessions()),
+        asyncio.create_task(revocation_store.run(settings.revocation_sync_interval_seconds)),
+        asyncio.create_task(sweep_rate_limiters(settings.rate_limit_sweep_interval_seconds)),
+        asyncio.create_task(pairing_codes.run(settings.pairing_sweep_interval_seconds)),
+        asyncio.create_task(audit.audit_logs.run(settings.audit_retention_interval_seconds))
+    ]
+    if settings.snapshot_enabled:
+        background_tasks.append(asyncio.create_task(snapshots.run(settings.snapshot_interval_seconds)))
+    app.state.ready = True
+    yield
+    # Fail readiness first so load balancers stop routing new traffic here
+    app.state.ready = False
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if settings.snapshot_enabled:
+        await snapshots.save()
+    await audit.audit_writer.stop()
+    auth.password_hasher.shutdown()
+    qr_generator.shutdown()
+    audit.audit_logs.close()
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Antigravity Link API",
     description="Remote control system for Antigravity",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
+app.state.ready = False
 
 # CORS middleware
 app.add_middleware(
@@ -33,6 +191,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Global per-IP limit for the REST API (WebSocket messages are limited per connection)
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=create_rate_limiter(
+        "global", settings.rate_limit_per_minute, settings.rate_limit_backend, settings.redis_url
+    ),
+    enabled=settings.rate_limit_enabled,
+)
+
+# Outermost, so rate-limited requests are measured too
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Authentication"])
 app.include_router(devices.router, prefix="/api/v1/devices", tags=["Devices"])
@@ -55,7 +225,31 @@ async def root():
     }
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving requests"""
     return {"status": "healthy", "version": settings.app_version}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: startup (storage, snapshot restore, workers) finished and not shutting down"""
+    checks = {
+        "startup_complete": app.state.ready,
+        "audit_writer": audit.audit_writer.stats()["running"],
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "checks": checks,
+            "snapshot_restored_from": snapshots.restored_at,
+        }
+    )
@@ -1,40 +1,111 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from datetime import datetime
+import asyncio
+from app.config import settings
+from app.utils.audit_log import AuditLog
+from app.utils.audit_writer import AuditWriter
+from app.utils.export import EXPORT_FORMATS, export_response
+from app.utils.fast_json import json_response
 
 router = APIRouter()
 
-# In-memory storage (replace with database in production)
-audit_logs = []
+# Append-only segmented log on disk (replace with database in production)
+audit_logs = AuditLog(
+    settings.audit_log_path,
+    segment_max_entries=settings.audit_segment_max_entries,
+    retention_days=settings.audit_retention_days,
+    max_segments=settings.audit_max_segments,
+    max_entries=settings.audit_max_entries
+)
+
+# Handlers enqueue events; a background task batches them to disk
+audit_writer = AuditWriter(
+    audit_logs,
+    max_queue_size=settings.audit_queue_max_size,
+    batch_size=settings.audit_batch_size,
+    flush_interval=settings.audit_flush_interval_seconds
+)
+
+MAX_PAGE_SIZE = 1000
+
+EXPORT_COLUMNS = ["cursor", "log_id", "timestamp", "device_id", "user_id", "action", "details"]
 
 
 @router.get("/logs")
-async def get_audit_logs(device_id: str = None, limit: int = 50, offset: int = 0):
-    """Get audit logs"""
-    filtered_logs = audit_logs
-    if device_id:
-        filtered_logs = [log for log in filtered_logs if log.get("device_id") == device_id]
-    
-    # Pagination
-    total = len(filtered_logs)
-    paginated = filtered_logs[offset:offset + limit]
+async def get_audit_logs(
+    device_id: str = None,
+    action: str = None,
+    since: datetime = None,
+    until: datetime = None,
+    cursor: int = None,
+    limit: int = 50,
+    offset: int = 0
+):
+    """Get audit logs (oldest first)
+
+    Pass the returned ``next_cursor`` back as ``cursor`` to fetch the next
+    page without offset scanning.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    # Disk seeks under the log's lock (shared with the writer thread): keep
+    # them off the event loop
+    page = await asyncio.to_thread(
+        audit_logs.query,
+        device_id=device_id,
+        action=action,
+        since=since,
+        until=until,
+        cursor=cursor,
+        limit=limit,
+        offset=max(0, offset)
+    )
     
-    return {
-        "logs": paginated,
-        "total": total,
+    # Entries are already JSON-shaped; skip jsonable_encoder's walk
+    return json_response({
+        "logs": page["logs"],
+        "total": page["total"],
         "limit": limit,
-        "offset": offset
-    }
+        "offset": offset,
+        "next_cursor": page["next_cursor"]
+    })
 
 
-def log_action(action: str, device_id: str, user_id: str, details: dict = None):
-    """Helper function to log an action"""
-    from datetime import datetime
+@router.get("/export")
+async def export_audit_logs(
+    format: str = "ndjson",
+    device_id: str = None,
+    action: str = None,
+    since: datetime = None,
+    until: datetime = None,
+    cursor: int = None
+):
+    """Stream audit logs as NDJSON or CSV (oldest first)
+
+    Each row has a ``cursor``; pass the last one received to resume.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
     
-    log_entry = {
-        "log_id": f"log_{len(audit_logs) + 1:03d}",
-        "timestamp": datetime.utcnow().isoformat(),
-        "device_id": device_id,
-        "user_id": user_id,
-        "action": action,
-        "details": details or {}
+    entries = audit_logs.iter_entries(
+        device_id=device_id,
+        action=action,
+        since=since,
+        until=until,
+        cursor=cursor
+    )
+    rows = ({"cursor": seq, **entry} for seq, entry in entries)
+    return export_response(rows, format, EXPORT_COLUMNS, "audit_logs")
+
+
+@router.get("/stats")
+async def get_audit_stats():
+    """Audit log and writer queue statistics"""
+    return {
+        "log": await asyncio.to_thread(audit_logs.stats),
+        "writer": audit_writer.stats()
     }
-    audit_logs.append(log_entry)
+
+
+def log_action(action: str, device_id: str, user_id: str, details: dict = None) -> bool:
+    """Helper function to log an action (non-blocking, may drop under overload)"""
+    return audit_writer.record(action, device_id, user_id, details)
@@ -1,59 +1,94 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from app.schemas.auth import UserRegister, UserLogin, TokenResponse, TokenRefresh
+from fastapi import APIRouter, HTTPException, Depends, Header, status
+from app.schemas.auth import UserRegister, UserLogin, TokenResponse, TokenRefresh, LogoutRequest
 from app.utils.security import (
-    get_password_hash,
-    verify_password,
+    password_needs_rehash,
     create_access_token,
     create_refresh_token,
     verify_token,
-    generate_device_id
+    revoke_token,
+    generate_device_id,
+    token_cache,
+    revocation_store
 )
-from datetime import timedelta
+from app.utils.password_hasher import PasswordHasher, HashingBusyError
+from app.utils.rate_limit import rate_limit
+from datetime import datetime, timedelta
+from typing import Optional
 from app.config import settings
+import logging
 
 # Import shared storage
-from app.storage import users_db, devices_db
+from app.storage import users_db, add_device
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# KDF work runs in a bounded pool so login bursts can't stall the event loop
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_concurrency=settings.password_hash_max_concurrency,
+    queue_timeout=settings.password_hash_queue_timeout_seconds
+)
+
+# Credential endpoints are the brute-force target: tight per-IP limit
+auth_rate_limit = rate_limit("auth", settings.auth_rate_limit_per_minute)
+
 
-@router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, please retry",
+        headers={"Retry-After": "1"}
+    )
+
+
+@router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[auth_rate_limit])
 async def register(user_data: UserRegister):
     """Register a new user"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
-        logger.info(f"Registration attempt for email: {user_data.email}")
+        logger.info("Registration attempt for email: %s", user_data.email, extra={"event": "auth.register"})
         
         # Check if user already exists
         if user_data.email in users_db:
-            logger.warning(f"Email already registered: {user_data.email}")
+            logger.warning("Email already registered: %s", user_data.email)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
         
         # Create user
+        try:
+            password_hash = await password_hasher.hash(user_data.password)
+        except HashingBusyError:
+            raise _hashing_busy()
+        if user_data.email in users_db:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
+        
         user_id = f"usr_{len(users_db) + 1}"
         users_db[user_data.email] = {
             "user_id": user_id,
             "email": user_data.email,
-            "password_hash": get_password_hash(user_data.password),
+            "password_hash": password_hash,
             "created_at": "2026-01-19T10:53:55Z"
         }
         
         # Create device for this user
         device_id = generate_device_id("mobile")
-        devices_db[device_id] = {
+        add_device({
             "device_id": device_id,
             "user_id": user_id,
             "device_name": user_data.device_name,
             "device_type": "mobile",
-            "status": "online"
-        }
+            "status": "online",
+            "paired_at": datetime.utcnow()
+        })
         
-        logger.info(f"User registered successfully: {user_id}, Device: {device_id}")
+        logger.info("User registered successfully: %s, Device: %s", user_id, device_id, extra={"event": "auth.register"})
         
         # Generate tokens
         token_data = {"sub": user_id, "email": user_data.email}
@@ -68,26 +103,41 @@ async def register(user_data: UserRegister):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Registration error: {str(e)}", exc_info=True)
+        logger.error("Registration error: %s", e, exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Registration failed: {str(e)}"
         )
 
 
-@router.post("/login", response_model=TokenResponse)
+@router.post("/login", response_model=TokenResponse, dependencies=[auth_rate_limit])
 async def login(user_data: UserLogin):
     """Login user"""
     # Find user
     user = users_db.get(user_data.email)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid credentials"
-        )
     
-    # Verify password
-    if not verify_password(user_data.password, user["password_hash"]):
+    # Verify password (unknown emails pay for a KDF run too, so response
+    # time doesn't reveal which accounts exist)
+    try:
+        if not user:
+            await password_hasher.verify_dummy(user_data.password)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid credentials"
+            )
+        valid = await password_hasher.verify(user_data.password, user["password_hash"])
+    except HashingBusyError:
+        raise _hashing_busy()
+    
+    if valid and password_needs_rehash(user["password_hash"]):
+        # Transparently upgrade legacy/outdated hashes; the old hash still
+        # works, so a busy pool just defers the upgrade to a later login
+        try:
+            user["password_hash"] = await password_hasher.hash(user_data.password)
+        except HashingBusyError:
+            logger.debug("Hash upgrade for %s deferred: hashing pool busy", user["user_id"])
+    
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
@@ -116,6 +166,9 @@ async def refresh_token(token_data: TokenRefresh):
             detail="Invalid refresh token"
         )
     
+    # Rotate: the presented refresh token can't be used again
+    await revoke_token(token_data.refresh_token, token_type="refresh")
+    
     # Generate new tokens
     new_token_data = {"sub": payload["sub"], "email": payload["email"]}
     access_token = create_access_token(new_token_data)
@@ -128,8 +181,28 @@ async def refresh_token(token_data: TokenRefresh):
     )
 
 
+@router.get("/token-cache")
+async def get_token_cache_stats():
+    """Verified-token cache and revocation statistics"""
+    return {
+        **token_cache.stats(),
+        "revocation": revocation_store.stats()
+    }
+
+
+@router.get("/password-hashing")
+async def get_password_hashing_stats():
+    """Password hashing pool statistics (per-hash latency, rejections)"""
+    return password_hasher.stats()
+
+
 @router.post("/logout")
-async def logout():
-    """Logout user (invalidate tokens in production)"""
-    # In production, add token to blacklist
-    return {"message": "Logged out successfully"}
+async def logout(logout_data: Optional[LogoutRequest] = None, authorization: str = Header(None)):
+    """Logout user (revokes the bearer access token and optional refresh token)"""
+    revoked = 0
+    if authorization and authorization.startswith("Bearer "):
+        revoked += await revoke_token(authorization.split(" ")[1], token_type="access")
+    if logout_data and logout_data.refresh_token:
+        revoked += await revoke_token(logout_data.refresh_token, token_type="refresh")
+    
+    return {"message": "Logged out successfully", "revoked_tokens": revoked}
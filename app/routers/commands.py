@@ -1,15 +1,30 @@
 from fastapi import APIRouter, HTTPException, status
 from app.schemas.command import CommandCreate, CommandResponse, CommandListResponse
+from app.routers.audit import log_action
+from app.routers.websocket import send_command_to_device
+from app.storage import commands_db, command_order
+from app.utils.audit_log import to_epoch
+from app.utils.export import EXPORT_FORMATS, export_response
+from app.utils.fast_json import json_response
+from app.utils.rate_limit import rate_limit
+from app.config import settings
+from bisect import bisect_left
 from datetime import datetime
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-# In-memory storage (replace with database + Redis in production)
-commands_db = {}
+EXPORT_COLUMNS = [
+    "cursor", "command_id", "target_device_id", "type", "status",
+    "created_at", "started_at", "completed_at", "payload", "result"
+]
 
 
-@router.post("", response_model=CommandResponse, status_code=status.HTTP_201_CREATED)
+@router.post("", response_model=CommandResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[rate_limit("commands", settings.command_rate_limit_per_minute, key="user")])
 async def create_command(command_data: CommandCreate):
     """Create a new command"""
     command_id = f"cmd_{uuid.uuid4().hex[:8]}"
@@ -27,20 +42,82 @@ async def create_command(command_data: CommandCreate):
     }
     
     commands_db[command_id] = command
+    command_order.append(command_id)
     
     # Send command to desktop via WebSocket
-    from app.routers.websocket import send_command_to_device
     try:
         sent = await send_command_to_device(command_data.target_device_id, command)
         if sent:
             command["status"] = "dispatched"
     except Exception as e:
-        import logging
-        logging.error(f"Failed to send command via WebSocket: {e}")
+        logger.error("Failed to send command via WebSocket: %s", e)
+    
+    log_action("command.create", command_data.target_device_id, None, {
+        "command_id": command_id,
+        "type": command_data.type,
+        "status": command["status"]
+    })
     
     return CommandResponse(**command)
 
 
+def _command_row(command: dict) -> dict:
+    """The ``CommandResponse`` fields of a stored command"""
+    return {
+        "command_id": command["command_id"],
+        "status": command["status"],
+        "created_at": command["created_at"],
+        "started_at": command.get("started_at"),
+        "completed_at": command.get("completed_at"),
+        "result": command.get("result")
+    }
+
+
+def _iter_command_export(device_id: str, since: datetime, until: datetime, cursor: int):
+    """Yield commands in creation order starting after ``cursor``"""
+    start = 0
+    if since:
+        since_ts = to_epoch(since)
+        start = bisect_left(
+            command_order, since_ts,
+            key=lambda cid: to_epoch(commands_db[cid]["created_at"])
+        )
+    if cursor is not None:
+        start = max(start, cursor + 1)
+    until_ts = to_epoch(until) if until else None
+    
+    # Bound the export to what existed when it started
+    end = len(command_order)
+    for index in range(start, end):
+        command = commands_db.get(command_order[index])
+        if command is None:
+            continue
+        if until_ts is not None and to_epoch(command["created_at"]) > until_ts:
+            break
+        if device_id and command["target_device_id"] != device_id:
+            continue
+        yield {"cursor": index, **command}
+
+
+@router.get("/export")
+async def export_commands(
+    format: str = "ndjson",
+    device_id: str = None,
+    since: datetime = None,
+    until: datetime = None,
+    cursor: int = None
+):
+    """Stream command history as NDJSON or CSV (oldest first)
+
+    Each row has a ``cursor``; pass the last one received to resume.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    
+    rows = _iter_command_export(device_id, since, until, cursor)
+    return export_response(rows, format, EXPORT_COLUMNS, "commands")
+
+
 @router.get("/{command_id}", response_model=CommandResponse)
 async def get_command(command_id: str):
     """Get command status and result"""
@@ -69,9 +146,15 @@ async def list_commands(device_id: str = None, limit: int = 20, offset: int = 0)
     total = len(filtered_commands)
     paginated = filtered_commands[offset:offset + limit]
     
-    return CommandListResponse(
-        commands=[CommandResponse(**cmd) for cmd in paginated],
-        total=total,
-        limit=limit,
-        offset=offset
+    # Rows are our own data: shape them like CommandResponse and skip
+    # per-row model construction (response_model still documents them)
+    return json_response(
+        {
+            "commands": [_command_row(cmd) for cmd in paginated],
+            "total": total,
+            "limit": limit,
+            "offset": offset
+        },
+        rows=len(paginated),
+        stream_min_rows=settings.json_stream_min_rows
     )
@@ -1,22 +1,37 @@
-from fastapi import APIRouter, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Header
 from app.schemas.device import (
     DeviceResponse,
     DeviceStatusResponse,
     PairingCodeResponse,
     PairingConfirm
 )
-from app.utils.security import generate_pairing_code, generate_device_id, verify_token
-from app.utils.qr_generator import generate_qr_code
-from datetime import datetime, timedelta
+from app.utils.security import generate_device_id, verify_token
+from app.utils.qr_generator import QR_FORMATS, render_qr_code
+from app.routers.audit import log_action
+from app.utils.http_files import etag_matches
+from app.utils.fast_json import json_response
+from app.utils.rate_limit import rate_limit
+from app.config import settings
+from datetime import datetime
 from typing import Optional
 
 # Import shared storage
-from app.storage import devices_db, pairing_codes_db
+from app.storage import (
+    devices_db,
+    pairing_codes,
+    user_devices,
+    add_device,
+    remove_device,
+    device_list_etag
+)
 
 router = APIRouter()
 
+# Shared by generate and confirm: also slows down guessing AG-XXXX-XXXX codes
+pairing_rate_limit = rate_limit("pairing", settings.pairing_rate_limit_per_minute, key="user")
+
 
-def get_current_user(authorization: str = Header(None)):
+async def get_current_user(authorization: str = Header(None)):
     """Dependency to get current user from token"""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -29,21 +44,37 @@ def get_current_user(authorization: str = Header(None)):
     return payload
 
 
+async def get_optional_user(authorization: str = Header(None)) -> Optional[dict]:
+    """Like get_current_user, but anonymous callers get None"""
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    return verify_token(authorization.split(" ")[1])
+
+
 @router.get("", response_model=list[DeviceResponse])
-async def get_devices(current_user: dict = None):
+async def get_devices(request: Request, current_user: dict = Depends(get_current_user)):
     """Get all devices for current user"""
-    # In production, filter by current user
+    user_id = current_user["sub"]
+    etag = device_list_etag(user_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
     devices = []
-    for device in devices_db.values():
-        devices.append(DeviceResponse(
-            device_id=device["device_id"],
-            device_name=device["device_name"],
-            device_type=device["device_type"],
-            status=device.get("status", "offline"),
-            last_seen=datetime.utcnow(),
-            paired_at=datetime.utcnow()
-        ))
-    return devices
+    for device_id in user_devices.get(user_id, ()):
+        device = devices_db[device_id]
+        devices.append({
+            "device_name": device["device_name"],
+            "device_type": device["device_type"],
+            "device_id": device_id,
+            "status": device.get("status", "offline"),
+            "last_seen": device.get("last_seen") or device["paired_at"],
+            "paired_at": device["paired_at"]
+        })
+    return json_response(devices, rows=len(devices), stream_min_rows=settings.json_stream_min_rows,
+                         headers=headers)
 
 
 @router.get("/{device_id}/status", response_model=DeviceStatusResponse)
@@ -61,36 +92,50 @@ async def get_device_status(device_id: str):
     )
 
 
-@router.post("/pairing/generate", response_model=PairingCodeResponse)
-async def generate_pairing_qr():
-    """Generate a pairing QR code"""
-    pairing_code = generate_pairing_code()
-    expires_at = datetime.utcnow() + timedelta(minutes=10)
+@router.post("/pairing/generate", response_model=PairingCodeResponse, dependencies=[pairing_rate_limit])
+async def generate_pairing_qr(
+    format: str = "png",
+    current_user: Optional[dict] = Depends(get_optional_user)
+):
+    """Generate a pairing QR code (``format``: png or svg)"""
+    if format not in QR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
     
-    # Store pairing code
-    pairing_codes_db[pairing_code] = {
-        "code": pairing_code,
-        "expires_at": expires_at,
-        "used": False
-    }
+    pairing_info = pairing_codes.create(current_user["sub"] if current_user else None)
+    return await _pairing_response(pairing_info, format)
+
+
+@router.get("/pairing/{pairing_code}/qr", response_model=PairingCodeResponse, dependencies=[pairing_rate_limit])
+async def get_pairing_qr(pairing_code: str, format: str = "png"):
+    """Re-render the QR code of a pending pairing code"""
+    if format not in QR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
     
-    # Generate QR data
+    pairing_info = pairing_codes.get(pairing_code)
+    if not pairing_info or pairing_info["used"] or datetime.utcnow() > pairing_info["expires_at"]:
+        raise HTTPException(status_code=404, detail="Invalid pairing code")
+    return await _pairing_response(pairing_info, format)
+
+
+async def _pairing_response(pairing_info: dict, format: str) -> PairingCodeResponse:
+    pairing_code = pairing_info["code"]
     qr_data = f"antigravity://pair?code={pairing_code}&server=relay.example.com"
-    qr_image = generate_qr_code(qr_data)
+    # Rendered on a worker pool (and cached) so bursts don't stall the relay
+    qr_image = await render_qr_code(qr_data, format)
     
     return PairingCodeResponse(
         pairing_code=pairing_code,
         qr_data=qr_data,
         qr_image=qr_image,
-        expires_at=expires_at
+        expires_at=pairing_info["expires_at"]
     )
 
 
-@router.post("/pairing/confirm")
+@router.post("/pairing/confirm", dependencies=[pairing_rate_limit])
 async def confirm_pairing(pairing_data: PairingConfirm):
     """Confirm device pairing with code"""
     # Verify pairing code
-    pairing_info = pairing_codes_db.get(pairing_data.pairing_code)
+    pairing_info = pairing_codes.get(pairing_data.pairing_code)
     if not pairing_info:
         raise HTTPException(status_code=404, detail="Invalid pairing code")
     
@@ -102,17 +147,20 @@ async def confirm_pairing(pairing_data: PairingConfirm):
     
     # Create device
     device_id = generate_device_id("desktop")
-    devices_db[device_id] = {
+    add_device({
         "device_id": device_id,
+        "user_id": pairing_info.get("user_id"),
         "device_name": pairing_data.device_name,
         "device_type": "desktop",
         "status": "online",
         "paired_at": datetime.utcnow()
-    }
+    })
     
     # Mark code as used
     pairing_info["used"] = True
     
+    log_action("device.pair", device_id, pairing_info.get("user_id"), {"device_name": pairing_data.device_name})
+    
     return {
         "device_id": device_id,
         "paired": True
@@ -125,5 +173,5 @@ async def unpair_device(device_id: str):
     if device_id not in devices_db:
         raise HTTPException(status_code=404, detail="Device not found")
     
-    del devices_db[device_id]
+    remove_device(device_id)
     return {"message": "Device unpaired successfully"}
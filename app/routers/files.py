@@ -1,75 +1,395 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
-from fastapi.responses import FileResponse
-from app.schemas.file import FileUploadResponse
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Request, status
+from app.schemas.file import (
+    FileUploadResponse,
+    UploadSessionCreate,
+    UploadSessionResponse,
+    UploadPartResponse
+)
+from datetime import datetime, timedelta
+import aiofiles
+import aiofiles.os
+import asyncio
+import logging
+import shutil
 import uuid
 import os
 from pathlib import Path
 from app.config import settings
+from app.routers.audit import log_action
+from app.routers.websocket import file_transfers
+from app.utils.blob_store import BlobStore
+from app.utils.http_files import detect_content_type, file_response
+from app.utils.rate_limit import rate_limit
+from app.utils.file_storage import (
+    FileTooLargeError,
+    MultipartError,
+    MultipartFileStream,
+    iter_files,
+    safe_filename,
+    write_stream
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# New uploads only; parts of an existing session fall under the global limit
+upload_rate_limit = rate_limit("uploads", settings.upload_rate_limit_per_minute, key="user")
+
 # In-memory storage (replace with database in production)
 files_db = {}
 
-# Ensure file storage directory exists
-Path(settings.file_storage_path).mkdir(parents=True, exist_ok=True)
+# Resumable upload sessions: {upload_id: session}
+upload_sessions = {}
+
+UPLOAD_SESSIONS_DIR = os.path.join(settings.file_storage_path, ".sessions")
+STAGING_DIR = os.path.join(settings.file_storage_path, ".staging")
+
+# Content-addressed blobs, reference-counted from files_db entries
+blob_store = BlobStore(os.path.join(settings.file_storage_path, "blobs"))
+
+
+def init_storage():
+    """Create the storage directories and clear out leftovers
+    (run from the app lifespan, not at import)
+
+    Upload sessions are not snapshotted, so session directories and staged
+    files from a previous run belong to nobody and would never be swept.
+    """
+    live_dirs = {session["dir"] for session in upload_sessions.values()}
+    for parent in (UPLOAD_SESSIONS_DIR, STAGING_DIR):
+        Path(parent).mkdir(parents=True, exist_ok=True)
+        for entry in os.scandir(parent):
+            if entry.path in live_dirs:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+
+# Multipart framing allowed on top of the file itself in Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# /upload parses the body itself; describe it for the OpenAPI schema
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "required": ["file"],
+                "properties": {"file": {"type": "string", "format": "binary"}}
+            }
+        }
+    }
+}
+
 
+def _check_content_length(request: Request, max_bytes: int, detail: str):
+    """Reject a body whose declared length is already over ``max_bytes``"""
+    try:
+        declared = int(request.headers.get("content-length", ""))
+    except ValueError:
+        return  # absent or chunked: the streaming check still applies
+    if declared > max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+
+
+def _staging_path() -> str:
+    return os.path.join(STAGING_DIR, uuid.uuid4().hex)
 
-@router.post("/upload", response_model=FileUploadResponse, status_code=status.HTTP_201_CREATED)
-async def upload_file(file: UploadFile = File(...), target_device_id: str = None):
-    """Upload a file"""
-    # Check file size
-    contents = await file.read()
-    file_size = len(contents)
+
+def _register_file(file_id: str, filename: str, staging_path: str, size_bytes: int,
+                   sha256: str, target_device_id: str = None) -> FileUploadResponse:
+    """Move a completed upload into the blob store and record it in files_db"""
+    file_path, deduplicated = blob_store.commit(staging_path, sha256, size_bytes)
+    uploaded_at = datetime.utcnow()
+    files_db[file_id] = {
+        "file_id": file_id,
+        "filename": filename,
+        "size_bytes": size_bytes,
+        "sha256": sha256,
+        "file_path": file_path,
+        "target_device_id": target_device_id,
+        "uploaded_at": uploaded_at
+    }
+    
+    log_action("file.upload", target_device_id, None, {
+        "file_id": file_id,
+        "filename": filename,
+        "size_bytes": size_bytes,
+        "deduplicated": deduplicated
+    })
+    
+    # Push to the target desktop (queued until it is connected)
+    if target_device_id:
+        file_transfers.enqueue(target_device_id, files_db[file_id])
     
+    return FileUploadResponse(
+        file_id=file_id,
+        filename=filename,
+        size_bytes=size_bytes,
+        uploaded_at=uploaded_at,
+        sha256=sha256
+    )
+
+
+@router.post("/upload", response_model=FileUploadResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[upload_rate_limit], openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_file(request: Request, target_device_id: str = None):
+    """Upload a file (multipart ``file`` field, streamed to disk as it arrives)"""
+    max_size_bytes = settings.max_file_size_mb * 1024 * 1024
+    too_large = f"File too large. Max size: {settings.max_file_size_mb}MB"
+    _check_content_length(request, max_size_bytes + MULTIPART_OVERHEAD_BYTES, too_large)
+    
+    try:
+        upload = MultipartFileStream(request.stream(), request.headers.get("content-type"), "file")
+    except MultipartError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    # Generate file ID and stream to disk, checking size and hashing as we go
+    file_id = f"file_{uuid.uuid4().hex[:8]}"
+    staging_path = _staging_path()
+    
+    try:
+        file_size, sha256 = await write_stream(upload.chunks(), staging_path, max_size_bytes)
+    except FileTooLargeError:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=too_large)
+    except MultipartError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    filename = safe_filename(upload.filename)
+    return _register_file(file_id, filename, staging_path, file_size, sha256, target_device_id)
+
+
+# --- Resumable uploads ---
+
+def _session_response(session: dict) -> UploadSessionResponse:
+    parts = session["parts"]
+    return UploadSessionResponse(
+        upload_id=session["upload_id"],
+        filename=session["filename"],
+        size_bytes=session["size_bytes"],
+        part_size_max=settings.upload_part_max_size_mb * 1024 * 1024,
+        received_parts=sorted(parts),
+        received_bytes=sum(part["size_bytes"] for part in parts.values()),
+        expires_at=session["expires_at"]
+    )
+
+
+def _get_session(upload_id: str) -> dict:
+    session = upload_sessions.get(upload_id)
+    if not session or session["expires_at"] < datetime.utcnow():
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+def _touch_session(session: dict):
+    """Slide the session TTL forward on activity"""
+    session["expires_at"] = datetime.utcnow() + timedelta(minutes=settings.upload_session_ttl_minutes)
+
+
+async def _discard_session(upload_id: str):
+    session = upload_sessions.pop(upload_id, None)
+    if session:
+        await asyncio.to_thread(shutil.rmtree, session["dir"], True)
+
+
+@router.post("/uploads", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[upload_rate_limit])
+async def create_upload_session(session_data: UploadSessionCreate):
+    """Start a resumable upload; parts can then be PUT in any order"""
     max_size_bytes = settings.max_file_size_mb * 1024 * 1024
-    if file_size > max_size_bytes:
+    if session_data.size_bytes is not None and session_data.size_bytes > max_size_bytes:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"File too large. Max size: {settings.max_file_size_mb}MB"
         )
     
-    # Generate file ID and save
-    file_id = f"file_{uuid.uuid4().hex[:8]}"
-    file_path = os.path.join(settings.file_storage_path, f"{file_id}_{file.filename}")
-    
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    upload_id = f"upl_{uuid.uuid4().hex}"
+    session_dir = os.path.join(UPLOAD_SESSIONS_DIR, upload_id)
+    await asyncio.to_thread(os.makedirs, session_dir, exist_ok=True)
     
-    # Store metadata
-    files_db[file_id] = {
-        "file_id": file_id,
-        "filename": file.filename,
-        "size_bytes": file_size,
-        "file_path": file_path,
-        "target_device_id": target_device_id,
-        "uploaded_at": datetime.utcnow()
+    session = {
+        "upload_id": upload_id,
+        "filename": safe_filename(session_data.filename),
+        "size_bytes": session_data.size_bytes,
+        "target_device_id": session_data.target_device_id,
+        "dir": session_dir,
+        "parts": {},
+        "part_locks": {},
+        "completing": False,
+        "created_at": datetime.utcnow()
     }
+    _touch_session(session)
+    upload_sessions[upload_id] = session
     
-    return FileUploadResponse(
-        file_id=file_id,
-        filename=file.filename,
-        size_bytes=file_size,
-        uploaded_at=datetime.utcnow()
+    return _session_response(session)
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(upload_id: str):
+    """Get the parts received so far (to resume after a disconnect)"""
+    return _session_response(_get_session(upload_id))
+
+
+@router.put("/uploads/{upload_id}/parts/{part_number}", response_model=UploadPartResponse)
+async def upload_part(upload_id: str, part_number: int, request: Request):
+    """Upload one numbered part (raw request body); re-sending a part replaces it"""
+    session = _get_session(upload_id)
+    if session["completing"]:
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+    if not 1 <= part_number <= settings.upload_max_parts:
+        raise HTTPException(status_code=400, detail=f"Part number must be 1-{settings.upload_max_parts}")
+    
+    # A part may not push the total past the file size limit
+    max_size_bytes = settings.max_file_size_mb * 1024 * 1024
+    other_bytes = sum(
+        part["size_bytes"] for number, part in session["parts"].items() if number != part_number
+    )
+    part_limit = min(settings.upload_part_max_size_mb * 1024 * 1024, max_size_bytes - other_bytes)
+    
+    _check_content_length(request, part_limit, "Part too large")
+    
+    part_path = os.path.join(session["dir"], f"{part_number:06d}.part")
+    # Concurrent PUTs of one part run one after the other, so the recorded
+    # size/sha256 always describe the file that ended up on disk
+    async with session["part_locks"].setdefault(part_number, asyncio.Lock()):
+        try:
+            size, sha256 = await write_stream(request.stream(), part_path, part_limit)
+        except FileTooLargeError:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Part too large"
+            )
+        
+        # The session may have been aborted or swept while the part was streaming
+        if upload_sessions.get(upload_id) is not session:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        
+        session["parts"][part_number] = {"size_bytes": size, "sha256": sha256, "path": part_path}
+        _touch_session(session)
+    
+    return UploadPartResponse(
+        upload_id=upload_id,
+        part_number=part_number,
+        size_bytes=size,
+        sha256=sha256
     )
 
 
+@router.post("/uploads/{upload_id}/complete", response_model=FileUploadResponse, status_code=status.HTTP_201_CREATED)
+async def complete_upload_session(upload_id: str):
+    """Assemble parts 1..N into a stored file"""
+    session = _get_session(upload_id)
+    if session["completing"]:
+        raise HTTPException(status_code=409, detail="Upload is being finalized")
+    
+    parts = session["parts"]
+    if not parts:
+        raise HTTPException(status_code=400, detail="No parts uploaded")
+    missing = [number for number in range(1, max(parts) + 1) if number not in parts]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing parts: {missing[:20]}")
+    
+    total = sum(part["size_bytes"] for part in parts.values())
+    if session["size_bytes"] is not None and total != session["size_bytes"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Received {total} bytes, expected {session['size_bytes']}"
+        )
+    
+    session["completing"] = True
+    file_id = f"file_{uuid.uuid4().hex[:8]}"
+    staging_path = _staging_path()
+    try:
+        size, sha256 = await write_stream(
+            iter_files([parts[n]["path"] for n in sorted(parts)], settings.upload_chunk_size_kb * 1024),
+            staging_path,
+            settings.max_file_size_mb * 1024 * 1024
+        )
+    except FileTooLargeError:
+        session["completing"] = False
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Max size: {settings.max_file_size_mb}MB"
+        )
+    except BaseException:
+        session["completing"] = False
+        raise
+    
+    await _discard_session(upload_id)
+    return _register_file(file_id, session["filename"], staging_path, size, sha256, session["target_device_id"])
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    """Abort a resumable upload and delete its parts"""
+    _get_session(upload_id)
+    await _discard_session(upload_id)
+    return {"message": "Upload aborted"}
+
+
+async def sweep_upload_sessions(interval: float = 60.0):
+    """Background task: drop expired upload sessions and their parts"""
+    while True:
+        await asyncio.sleep(interval)
+        now = datetime.utcnow()
+        expired = [
+            upload_id for upload_id, session in upload_sessions.items()
+            if session["expires_at"] < now and not session["completing"]
+        ]
+        for upload_id in expired:
+            await _discard_session(upload_id)
+        if expired:
+            logger.info("Garbage-collected %d expired upload sessions", len(expired))
+
+
+@router.get("/stats")
+async def get_file_stats():
+    """Storage and deduplication statistics"""
+    return {"files": len(files_db), **blob_store.stats()}
+
+
+@router.get("/transfers")
+async def list_file_transfers(device_id: str = None):
+    """Queued and in-flight file pushes to desktops"""
+    return {
+        "transfers": file_transfers.pending(device_id),
+        **file_transfers.stats()
+    }
+
+
 @router.get("/{file_id}/download")
-async def download_file(file_id: str):
-    """Download a file"""
+async def download_file(file_id: str, request: Request):
+    """Download a file (supports ETag/If-Modified-Since, Range and gzip)"""
     file_info = files_db.get(file_id)
     if not file_info:
         raise HTTPException(status_code=404, detail="File not found")
     
     file_path = file_info["file_path"]
-    if not os.path.exists(file_path):
+    if not await aiofiles.os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="File not found on disk")
     
-    return FileResponse(
+    # Detect once and keep it with the metadata
+    content_type = file_info.get("content_type")
+    if not content_type:
+        async with aiofiles.open(file_path, "rb") as f:
+            head = await f.read(512)
+        content_type = file_info["content_type"] = detect_content_type(file_info["filename"], head)
+    
+    return file_response(
+        request,
         path=file_path,
         filename=file_info["filename"],
-        media_type="application/octet-stream"
+        size=file_info["size_bytes"],
+        content_type=content_type,
+        last_modified=file_info["uploaded_at"],
+        sha256=file_info.get("sha256")
     )
 
 
@@ -80,11 +400,16 @@ async def delete_file(file_id: str):
     if not file_info:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete file from disk
-    try:
-        os.remove(file_info["file_path"])
-    except OSError:
-        pass
+    file_transfers.cancel_file(file_id)
+    
+    # Drop the blob reference; the blob itself goes with its last reference
+    if blob_store.owns(file_info.get("sha256"), file_info["file_path"]):
+        blob_store.release(file_info["sha256"])
+    else:
+        try:
+            os.remove(file_info["file_path"])
+        except OSError:
+            pass
     
     # Remove from database
     del files_db[file_id]
@@ -2,8 +2,11 @@ from fastapi import APIRouter, HTTPException, Query, Body
 import uuid
 import asyncio
 import logging
+import time
 from typing import List, Optional
 from app.routers.websocket import active_connections, pending_requests
+from app.routers.audit import log_action
+from app.utils.metrics import DESKTOP_RPC_SECONDS, DESKTOP_RPC_TIMEOUTS
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -28,13 +31,16 @@ async def desktop_request(device_id: str, message_type: str, payload: dict = Non
         request_msg.update(payload)
         
     try:
+        start = time.perf_counter()
         await websocket.send_json(request_msg)
         # Wait for response with timeout
         response = await asyncio.wait_for(future, timeout=timeout)
+        DESKTOP_RPC_SECONDS.labels(message_type).observe(time.perf_counter() - start)
         if response.get("type") == "error":
              raise HTTPException(status_code=500, detail=response.get("message", "Desktop Error"))
         return response
     except asyncio.TimeoutError:
+        DESKTOP_RPC_TIMEOUTS.labels(message_type).inc()
         if request_id in pending_requests:
             del pending_requests[request_id]
         raise HTTPException(status_code=504, detail="Desktop agent timed out")
@@ -69,6 +75,11 @@ async def write_project_file(project_id: str, device_id: str, path: str, content
         "path": path, 
         "content": content
     })
+    log_action("project.write_file", device_id, None, {
+        "project_id": project_id,
+        "path": path,
+        "size_bytes": len(content)
+    })
     return {"success": True}
 
 @router.post("/refresh")
@@ -92,4 +103,9 @@ async def run_project_command(project_id: str, device_id: str, command: str = Bo
         "command": command,
         "exec_id": exec_id
     })
+    log_action("project.exec", device_id, None, {
+        "project_id": project_id,
+        "exec_id": exec_id,
+        "command": command
+    })
     return {"exec_id": exec_id, "status": "started"}
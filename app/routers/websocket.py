@@ -4,6 +4,18 @@ from datetime import datetime
 import logging
 import json
 import asyncio
+from app.config import settings
+from app.storage import commands_db, devices_db, add_device, assign_device_owner, update_device
+from app.utils.file_transfer import FileTransferManager
+from app.utils.security import verify_token
+from app.utils.rate_limit import TokenBucket
+from app.utils.metrics import (
+    WS_MESSAGES,
+    WS_RELAY_SECONDS,
+    WS_SEND_FAILURES,
+    COMMAND_DURATION_SECONDS
+)
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +27,50 @@ active_connections: Dict[str, WebSocket] = {}
 # Pending requests from REST API to Desktop Agent: {request_id: asyncio.Future}
 pending_requests: Dict[str, asyncio.Future] = {}
 
-# Command storage (import from commands.py storage)
-from app.routers.commands import commands_db
+# Queued/active file pushes to desktops (resumed when a device reconnects)
+file_transfers = FileTransferManager(
+    chunk_size=settings.file_transfer_chunk_kb * 1024,
+    window_bytes=settings.file_transfer_window_kb * 1024,
+    bandwidth_bytes_per_sec=settings.file_transfer_bandwidth_kbps * 1024,
+    ack_timeout=settings.file_transfer_ack_timeout_seconds
+)
+
+# Inbound message rate limiting: paced by the server, never limited
+UNLIMITED_MESSAGE_TYPES = {"file_transfer_ack", "file_transfer_resume", "file_transfer_error"}
+# Dropped when over the limit; anything else is still handled but counts as a violation
+SHEDDABLE_MESSAGE_TYPES = {"heartbeat", "command_chunk", "proc_stdout"}
+RATE_LIMIT_CLOSE_CODE = 4029
+
+# Message types counted under their own label; anything else is "other"
+KNOWN_MESSAGE_TYPES = {
+    "heartbeat", "command_complete", "command_error", "command_chunk",
+    "file_transfer_ack", "file_transfer_resume", "file_transfer_error",
+    "projects_list", "project_tree", "file_content", "write_success", "error",
+    "proc_stdout", "proc_exit",
+}
+
+
+
+async def _relay_to_mobiles(kind: str, message: dict):
+    """Send ``message`` to every connected mobile (serialized once)"""
+    start = time.perf_counter()
+    text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+    for conn_id, conn_ws in list(active_connections.items()):
+        if conn_id.startswith("dev_mobile_"):
+            try:
+                await conn_ws.send_text(text)
+            except Exception as e:
+                WS_SEND_FAILURES.labels(kind).inc()
+                logger.error("Failed to relay %s to %s: %s", kind, conn_id, e, extra={"event": "ws.relay_failed"})
+    WS_RELAY_SECONDS.labels(kind).observe(time.perf_counter() - start)
+
+
+def _observe_command_stage(command: dict, stage: str):
+    created_at = command.get("created_at")
+    if created_at:
+        COMMAND_DURATION_SECONDS.labels(stage).observe(
+            (datetime.utcnow() - created_at).total_seconds()
+        )
 
 
 @router.websocket("/ws")
@@ -34,7 +88,7 @@ async def websocket_endpoint(websocket: WebSocket):
             )
             init_message = json.loads(init_message_text)
         except Exception as e:
-            logger.error(f"WebSocket identification failed: {e}")
+            logger.error("WebSocket identification failed: %s", e)
             await websocket.close(code=4001, reason="Identification failed")
             return
             
@@ -46,24 +100,49 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.close(code=4001, reason="No device_id provided")
             return
         
+        # Optional bearer token in the init message (or ?token=), verified via the token cache
+        token = init_message.get("token") or websocket.query_params.get("token")
+        user = None
+        if token:
+            user = verify_token(token)
+            if not user:
+                logger.warning("WebSocket auth failed for %s", device_id, extra={"event": "ws.auth_failed"})
+                await websocket.close(code=4003, reason="Invalid token")
+                return
+        elif settings.ws_require_auth:
+            await websocket.close(code=4003, reason="Authentication required")
+            return
+
+        # An owned device can only be claimed with its owner's token, with or
+        # without ws_require_auth; otherwise anyone could take over its slot
+        existing = devices_db.get(device_id)
+        owner_id = existing.get("user_id") if existing else None
+        if owner_id is not None and (user is None or user["sub"] != owner_id):
+            logger.warning("WebSocket for %s rejected: not authenticated as its owner", device_id,
+                           extra={"event": "ws.auth_failed"})
+            await websocket.close(code=4003, reason="Device belongs to another user")
+            return
+
         # Register connection (save reference to this specific websocket for safe cleanup)
         active_connections[device_id] = websocket
-        logger.info(f"Device connected via WebSocket: {device_id} ({device_type})")
+        logger.info("Device connected via WebSocket: %s (%s)", device_id, device_type, extra={"event": "ws.connect"})
         
         # Auto-register in devices_db if not exists (Survive backend restarts)
-        from app.storage import devices_db
         if device_id not in devices_db:
-            devices_db[device_id] = {
+            add_device({
                 "device_id": device_id,
+                "user_id": user["sub"] if user else None,
                 "device_name": init_message.get("device_name", "Unknown Device"),
                 "device_type": device_type,
                 "status": "online",
                 "paired_at": datetime.utcnow()
-            }
-            logger.info(f"Auto-registered device {device_id} in DB")
+            })
+            logger.info("Auto-registered device %s in DB", device_id)
         else:
-            devices_db[device_id]["status"] = "online"
-            logger.info(f"Updated status to online for device {device_id}")
+            if user:
+                assign_device_owner(device_id, user["sub"])
+            update_device(device_id, status="online")
+            logger.debug("Updated status to online for device %s", device_id)
         
         # Acknowledge connection
         await websocket.send_json({
@@ -72,6 +151,12 @@ async def websocket_endpoint(websocket: WebSocket):
             "message": "Connected successfully"
         })
         
+        # Deliver any files queued for this device while it was offline
+        file_transfers.attach(device_id, websocket)
+        
+        bucket = TokenBucket(settings.ws_message_rate_per_second, settings.ws_message_burst)
+        violations = 0
+        
         # Main message loop
         while True:
             try:
@@ -81,14 +166,30 @@ async def websocket_endpoint(websocket: WebSocket):
                 )
                 message = json.loads(message_text)
                 message_type = message.get("type")
+                WS_MESSAGES.labels(message_type if message_type in KNOWN_MESSAGE_TYPES else "other").inc()
+                
+                if settings.rate_limit_enabled and message_type not in UNLIMITED_MESSAGE_TYPES:
+                    if bucket.take():
+                        violations = 0
+                    else:
+                        violations += 1
+                        if violations >= settings.ws_rate_limit_max_violations:
+                            logger.warning("Closing %s: sustained message rate over limit", device_id)
+                            await websocket.close(code=RATE_LIMIT_CLOSE_CODE, reason="Rate limit exceeded")
+                            break
+                        if violations == 1:
+                            await websocket.send_json({
+                                "type": "rate_limited",
+                                "retry_after": round(1 / settings.ws_message_rate_per_second, 3)
+                            })
+                        if message_type in SHEDDABLE_MESSAGE_TYPES:
+                            continue
                 
-                logger.debug(f"Received WebSocket message from {device_id}: {message_type}")
+                logger.debug("Received WebSocket message from %s: %s", device_id, message_type, extra={"event": "ws.message"})
                 
                 if message_type == "heartbeat":
                     # Update status in DB
-                    if device_id in devices_db:
-                        devices_db[device_id]["status"] = "online"
-                        devices_db[device_id]["last_seen"] = datetime.utcnow()
+                    update_device(device_id, status="online", last_seen=datetime.utcnow())
                     
                     # Echo heartbeat to keep connection alive
                     await websocket.send_json({
@@ -101,70 +202,64 @@ async def websocket_endpoint(websocket: WebSocket):
                     command_id = message.get("command_id")
                     response_text = message.get("response", "")
                     
-                    logger.info(f"Command {command_id} complete. Processing storage and relay.")
+                    logger.info("Command %s complete", command_id, extra={"event": "command.complete"})
                     
                     # 1. Store in database
                     if command_id in commands_db:
                         commands_db[command_id]["status"] = "completed"
                         commands_db[command_id]["completed_at"] = datetime.utcnow()
                         commands_db[command_id]["result"] = response_text
-                        logger.info(f"Stored response for command {command_id}")
+                        _observe_command_stage(commands_db[command_id], "completed")
+                        logger.debug("Stored response for command %s", command_id)
                     
                     # 2. Relay to mobile devices
-                    for conn_id, conn_ws in list(active_connections.items()):
-                        if conn_id.startswith("dev_mobile_"):
-                            try:
-                                await conn_ws.send_json({
-                                    "type": "command_response",
-                                    "command_id": command_id,
-                                    "response": response_text
-                                })
-                            except Exception as e:
-                                logger.error(f"Failed to relay to {conn_id}: {e}")
+                    await _relay_to_mobiles("command_response", {
+                        "type": "command_response",
+                        "command_id": command_id,
+                        "response": response_text
+                    })
                 
                 elif message_type == "command_error":
                     # Desktop error
                     command_id = message.get("command_id")
                     error = message.get("error", "Unknown error")
                     
-                    logger.error(f"Command {command_id} failed on desktop: {error}")
+                    logger.error("Command %s failed on desktop: %s", command_id, error, extra={"event": "command.error"})
                     
                     # Update DB
                     if command_id in commands_db:
                         commands_db[command_id]["status"] = "failed"
                         commands_db[command_id]["result"] = f"Error: {error}"
+                        _observe_command_stage(commands_db[command_id], "failed")
                     
                     # Relay to mobile
-                    for conn_id, conn_ws in list(active_connections.items()):
-                        if conn_id.startswith("dev_mobile_"):
-                            try:
-                                await conn_ws.send_json({
-                                    "type": "command_error",
-                                    "command_id": command_id,
-                                    "error": error
-                                })
-                            except Exception as e:
-                                logger.error(f"Failed to relay error to {conn_id}: {e}")
+                    await _relay_to_mobiles("command_error", {
+                        "type": "command_error",
+                        "command_id": command_id,
+                        "error": error
+                    })
                 
                 elif message_type == "command_chunk":
                     # Desktop sending streaming response chunk
                     command_id = message.get("command_id")
                     chunk = message.get("chunk", "")
                     
-                    if command_id in commands_db:
-                        commands_db[command_id]["status"] = "executing"
+                    command = commands_db.get(command_id)
+                    if command is not None:
+                        command["status"] = "executing"
+                        if command.get("started_at") is None:
+                            command["started_at"] = datetime.utcnow()
+                            _observe_command_stage(command, "first_chunk")
                     
                     # Relay to mobile
-                    for conn_id, conn_ws in list(active_connections.items()):
-                        if conn_id.startswith("dev_mobile_"):
-                            try:
-                                await conn_ws.send_json({
-                                    "type": "command_chunk",
-                                    "command_id": command_id,
-                                    "chunk": chunk
-                                })
-                            except Exception as e:
-                                logger.error(f"Failed to relay chunk to {conn_id}: {e}")
+                    await _relay_to_mobiles("command_chunk", {
+                        "type": "command_chunk",
+                        "command_id": command_id,
+                        "chunk": chunk
+                    })
+                
+                elif message_type in ["file_transfer_ack", "file_transfer_resume", "file_transfer_error"]:
+                    file_transfers.handle_message(device_id, message)
                 
                 # --- New Remote Project Handlers ---
                 
@@ -178,12 +273,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 
                 elif message_type in ["proc_stdout", "proc_exit"]:
                     # Relay real-time process output to all mobile devices
-                    for conn_id, conn_ws in list(active_connections.items()):
-                        if conn_id.startswith("dev_mobile_"):
-                            try:
-                                await conn_ws.send_json(message)
-                            except Exception as e:
-                                logger.error(f"Failed to relay process log to {conn_id}: {e}")
+                    await _relay_to_mobiles(message_type, message)
             
             except asyncio.TimeoutError:
                 # Keep-alive ping
@@ -196,18 +286,20 @@ async def websocket_endpoint(websocket: WebSocket):
                 break
             
             except Exception as e:
-                logger.error(f"Error handling message from {device_id}: {e}")
+                logger.error("Error handling message from %s: %s", device_id, e)
                 break
     
     except Exception as e:
-        logger.error(f"WebSocket session error for {device_id}: {e}")
+        logger.error("WebSocket session error for %s: %s", device_id, e)
     
     finally:
+        if device_id:
+            file_transfers.detach(device_id, websocket)
         # Safe cleanup: only remove if it's still THIS specific connection
         if device_id and active_connections.get(device_id) == websocket:
             del active_connections[device_id]
-            logger.info(f"Device {device_id} WebSocket removed from registry")
-        logger.info(f"WebSocket connection closed for {device_id}")
+            logger.debug("Device %s WebSocket removed from registry", device_id)
+        logger.info("WebSocket connection closed for %s", device_id, extra={"event": "ws.disconnect"})
 
 
 
@@ -216,7 +308,7 @@ async def send_command_to_device(device_id: str, command: dict) -> bool:
     websocket = active_connections.get(device_id)
     
     if not websocket:
-        logger.warning(f"Device {device_id} not connected via WebSocket")
+        logger.warning("Device %s not connected via WebSocket", device_id, extra={"event": "command.undeliverable"})
         return False
     
     try:
@@ -226,10 +318,11 @@ async def send_command_to_device(device_id: str, command: dict) -> bool:
             "command_id": command["command_id"],
             "payload": command["payload"]
         })
-        logger.info(f"Command {command['command_id']} dispatched to device {device_id}")
+        logger.info("Command %s dispatched to device %s", command["command_id"], device_id, extra={"event": "command.dispatch"})
         return True
     except Exception as e:
-        logger.error(f"Failed to send command to device {device_id}: {e}")
+        WS_SEND_FAILURES.labels("command_dispatch").inc()
+        logger.error("Failed to send command to device %s: %s", device_id, e)
         # Remove dead connection
         if device_id in active_connections:
             del active_connections[device_id]
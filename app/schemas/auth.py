@@ -27,3 +27,8 @@ class TokenResponse(BaseModel):
 class TokenRefresh(BaseModel):
     """Token refresh request"""
     refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    """Logout request (refresh token is revoked too when given)"""
+    refresh_token: Optional[str] = None
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 
 
 class FileUploadResponse(BaseModel):
@@ -8,6 +9,33 @@ class FileUploadResponse(BaseModel):
     filename: str
     size_bytes: int
     uploaded_at: datetime
+    sha256: Optional[str] = None
     
     class Config:
         from_attributes = True
+
+
+class UploadSessionCreate(BaseModel):
+    """Resumable upload session request"""
+    filename: str
+    size_bytes: Optional[int] = None
+    target_device_id: Optional[str] = None
+
+
+class UploadSessionResponse(BaseModel):
+    """Resumable upload session state"""
+    upload_id: str
+    filename: str
+    size_bytes: Optional[int] = None
+    part_size_max: int
+    received_parts: list[int]
+    received_bytes: int
+    expires_at: datetime
+
+
+class UploadPartResponse(BaseModel):
+    """Stored upload part"""
+    upload_id: str
+    part_number: int
+    size_bytes: int
+    sha256: str
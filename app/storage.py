@@ -1,12 +1,121 @@
 """Shared in-memory storage for MVP
 In production, replace with actual database
 """
+import secrets
+
+from app.config import settings
+from app.utils.pairing_store import PairingCodeStore
 
 # Users database
 users_db = {}
 
-# Devices database  
+# Devices database
 devices_db = {}
 
-# Pairing codes database
-pairing_codes_db = {}
+# Commands database
+commands_db = {}
+
+# Command ids in creation order (append-only), used as the export cursor space
+command_order = []
+
+# Pairing codes (expire after the TTL, swept in the background)
+pairing_codes = PairingCodeStore(
+    ttl_seconds=settings.pairing_code_ttl_minutes * 60,
+    max_codes=settings.pairing_max_codes
+)
+
+# Per-user device index, in pairing order: {user_id: {device_id: None}}
+user_devices = {}
+
+# Device list versions for ETags: {user_id: version}. Versions come from one
+# global counter, prefixed with a per-process epoch so they never repeat
+# across restarts or users.
+device_list_versions = {}
+_device_list_epoch = secrets.token_hex(4)
+_device_list_counter = 0
+
+
+def _bump_device_list(user_id):
+    global _device_list_counter
+    if user_id is None:
+        return
+    _device_list_counter += 1
+    device_list_versions[user_id] = _device_list_counter
+
+
+def device_list_etag(user_id) -> str:
+    return f'"{_device_list_epoch}-{device_list_versions.get(user_id, 0)}"'
+
+
+def add_device(device: dict):
+    """Insert or replace a device and index it under its owner"""
+    device_id = device["device_id"]
+    previous = devices_db.get(device_id)
+    if previous is not None and previous.get("user_id") != device.get("user_id"):
+        _unindex_device(device_id, previous.get("user_id"))
+    devices_db[device_id] = device
+    user_id = device.get("user_id")
+    if user_id is not None:
+        user_devices.setdefault(user_id, {})[device_id] = None
+    _bump_device_list(user_id)
+
+
+def assign_device_owner(device_id: str, user_id: str):
+    """Attach an existing, unowned device to ``user_id``"""
+    device = devices_db[device_id]
+    if device.get("user_id") is None:
+        device["user_id"] = user_id
+        user_devices.setdefault(user_id, {})[device_id] = None
+        _bump_device_list(user_id)
+
+
+def remove_device(device_id: str):
+    device = devices_db.pop(device_id)
+    _unindex_device(device_id, device.get("user_id"))
+
+
+def _unindex_device(device_id: str, user_id):
+    if user_id is None:
+        return
+    owned = user_devices.get(user_id)
+    if owned is not None:
+        owned.pop(device_id, None)
+        if not owned:
+            del user_devices[user_id]
+    _bump_device_list(user_id)
+
+
+def restore_devices(devices: dict):
+    """Replace ``devices_db`` (e.g. from a snapshot) and rebuild the owner index"""
+    devices_db.clear()
+    devices_db.update(devices)
+    user_devices.clear()
+    for device_id, device in devices_db.items():
+        # Nobody is connected right after a restart
+        device["status"] = "offline"
+        user_id = device.get("user_id")
+        if user_id is not None:
+            user_devices.setdefault(user_id, {})[device_id] = None
+            _bump_device_list(user_id)
+
+
+# Listed fields whose changes invalidate the device-list ETag. ``last_seen``
+# is left out on purpose: every heartbeat moves it, and counting it would
+# mean an owner with an online desktop never gets a 304.
+VERSIONED_DEVICE_FIELDS = ("status", "device_name", "device_type")
+
+
+def update_device(device_id: str, **fields):
+    """Set fields on a stored device, bumping its owner's list version only
+    when a versioned field actually changes"""
+    device = devices_db.get(device_id)
+    if device is None:
+        return
+    changed = any(
+        name in VERSIONED_DEVICE_FIELDS and device.get(name) != value
+        for name, value in fields.items()
+    )
+    device.update(fields)
+    if changed:
+        _bump_device_list(device.get("user_id"))
+
@@ -0,0 +1,477 @@
+"""Append-only audit log stored in rotating segment files
+
+Entries are written as JSON lines to ``audit-<first_seq>.log`` segments.
+Only compact per-entry columns (timestamp, byte offset, action code) and
+per-device / per-action sequence arrays are kept in memory, so queries are
+answered with bisects over the indexes and a handful of seeks into the
+segment files. That index costs a few dozen bytes per entry, so besides the
+age and segment-count limits, whole segments are dropped once more than
+``max_entries`` entries are retained.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional
+import asyncio
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "audit-"
+SEGMENT_SUFFIX = ".log"
+
+# Segment files kept open for reads (least recently used are closed)
+MAX_OPEN_READERS = 16
+
+
+def to_epoch(value: Optional[datetime]) -> Optional[float]:
+    """Convert a (naive UTC or aware) datetime to a POSIX timestamp"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat()
+
+
+class _SeqSlice:
+    """Read-only view over ``seqs[start:stop]`` without copying"""
+
+    __slots__ = ("seqs", "start", "stop")
+
+    def __init__(self, seqs, start: int, stop: int):
+        self.seqs = seqs
+        self.start = start
+        self.stop = max(start, stop)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __iter__(self):
+        for i in range(self.start, self.stop):
+            yield self.seqs[i]
+
+
+class AuditLog:
+    """Segmented, append-only audit log with in-memory indexes"""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_entries: int = 50_000,
+        retention_days: int = 30,
+        max_segments: int = 200,
+        max_entries: int = 2_000_000,
+    ):
+        self.directory = Path(directory)
+        self.segment_max_entries = segment_max_entries
+        self.retention_days = retention_days
+        self.max_segments = max_segments
+        self.max_entries = max_entries
+
+        self._loaded = False
+        self._base_seq = 0  # seq of the oldest retained entry
+        self._next_seq = 0
+        self._last_ts = 0.0
+
+        # Columns indexed by ``seq - base_seq``
+        self._timestamps = array("d")
+        self._offsets = array("Q")
+        self._action_codes = array("I")
+
+        self._actions: list[str] = []
+        self._action_ids: dict[str, int] = {}
+        self._by_device: dict[str, array] = {}
+        self._by_action: dict[str, array] = {}
+
+        self._segments: list[int] = []  # first seq of every segment, ascending
+        self._writer = None
+        self._write_pos = 0
+        self._readers: OrderedDict[int, object] = OrderedDict()
+
+        # Batched writes run in a worker thread while queries run on the loop
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _segment_path(self, first_seq: int) -> Path:
+        return self.directory / f"{SEGMENT_PREFIX}{first_seq:012d}{SEGMENT_SUFFIX}"
+
+    def load(self):
+        """Build the in-memory index now (it is otherwise built on first use)
+
+        Reads every retained segment; call it from a worker thread at
+        startup rather than letting the first query pay for it.
+        """
+        with self._lock:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        segment_files = []
+        for path in self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"):
+            try:
+                first_seq = int(path.name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+            segment_files.append((first_seq, path))
+        segment_files.sort()
+
+        for first_seq, path in segment_files:
+            if not self._segments:
+                self._base_seq = self._next_seq = first_seq
+            elif first_seq != self._next_seq:
+                # Gap from a partially deleted segment: seqs must be contiguous,
+                # so everything before it is dropped like an expired segment
+                self._reset_index(first_seq)
+            self._segments.append(first_seq)
+            self._load_segment(path)
+
+        self._loaded = True
+        self._apply_retention()
+
+    def _reset_index(self, first_seq: int):
+        logger.warning(
+            "Audit segment gap before seq %d: dropping %d earlier segment(s)",
+            first_seq, len(self._segments)
+        )
+        for first in self._segments:
+            self._close_reader(first)
+            try:
+                self._segment_path(first).unlink()
+            except OSError:
+                pass
+        self._segments.clear()
+        self._base_seq = self._next_seq = first_seq
+        del self._timestamps[:], self._offsets[:], self._action_codes[:]
+        self._by_device.clear()
+        self._by_action.clear()
+
+    def _load_segment(self, path: Path):
+        offset = 0
+        with open(path, "rb+") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn write from a crash: drop the partial record
+                    f.truncate(offset)
+                    break
+                try:
+                    entry = json.loads(line)
+                    ts = to_epoch(datetime.fromisoformat(entry["timestamp"]))
+                except (ValueError, KeyError, TypeError):
+                    f.truncate(offset)
+                    break
+                self._index(offset, ts, entry.get("device_id"), entry.get("action", ""))
+                offset += len(line)
+        self._write_pos = offset
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def _index(self, offset: int, ts: float, device_id: Optional[str], action: str) -> int:
+        seq = self._next_seq
+        self._next_seq += 1
+        self._last_ts = max(self._last_ts, ts)
+
+        code = self._action_ids.get(action)
+        if code is None:
+            code = len(self._actions)
+            self._actions.append(action)
+            self._action_ids[action] = code
+
+        self._timestamps.append(ts)
+        self._offsets.append(offset)
+        self._action_codes.append(code)
+        if device_id:
+            self._by_device.setdefault(device_id, array("Q")).append(seq)
+        self._by_action.setdefault(action, array("Q")).append(seq)
+        return seq
+
+    def _open_writer(self):
+        if not self._segments or self._rotation_due():
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+            self._segments.append(self._next_seq)
+            self._write_pos = 0
+            self._apply_retention()
+        if self._writer is None:
+            self._writer = open(self._segment_path(self._segments[-1]), "ab")
+
+    def append(
+        self,
+        action: str,
+        device_id: Optional[str],
+        user_id: Optional[str],
+        details: Optional[dict] = None,
+        timestamp: Optional[float] = None,
+    ) -> dict:
+        """Append one entry and return it"""
+        return self.extend([(action, device_id, user_id, details, timestamp)])[0]
+
+    def extend(self, events: Iterable[tuple]) -> list[dict]:
+        """Append ``(action, device_id, user_id, details, timestamp)`` events
+
+        Each batch is written with a single ``write``/``flush`` per segment.
+        """
+        entries = []
+        with self._lock:
+            self._ensure_loaded()
+            buffer = []
+            for action, device_id, user_id, details, timestamp in events:
+                if self._rotation_due():
+                    self._flush(buffer)
+                self._open_writer()
+
+                # Timestamps are kept monotonic so the time index can be bisected
+                ts = max(timestamp if timestamp is not None else time.time(), self._last_ts)
+                entry = {
+                    "log_id": f"log_{self._next_seq + 1:03d}",
+                    "timestamp": _iso(ts),
+                    "device_id": device_id,
+                    "user_id": user_id,
+                    "action": action,
+                    "details": details or {},
+                }
+                line = json.dumps(entry, separators=(",", ":"), default=str).encode() + b"\n"
+                buffer.append(line)
+
+                self._index(self._write_pos, ts, device_id, action)
+                self._write_pos += len(line)
+                entries.append(entry)
+            self._flush(buffer)
+        return entries
+
+    def _rotation_due(self) -> bool:
+        return bool(self._segments) and self._next_seq - self._segments[-1] >= self.segment_max_entries
+
+    def _flush(self, buffer: list):
+        if buffer:
+            self._writer.write(b"".join(buffer))
+            self._writer.flush()
+            buffer.clear()
+
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+
+    def apply_retention(self, now: Optional[float] = None):
+        """Drop whole segments that are too old or exceed ``max_segments`` /
+        ``max_entries``"""
+        with self._lock:
+            self._apply_retention(now)
+
+    def _apply_retention(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        cutoff = now - self.retention_days * 86400 if self.retention_days else None
+
+        # The active (last) segment is never dropped; it is counted as full
+        # so the index stays under max_entries until the next rotation
+        while len(self._segments) > 1:
+            next_first = self._segments[1]
+            retained = self._segments[-1] + self.segment_max_entries - self._base_seq
+            too_many = (
+                (self.max_segments and len(self._segments) > self.max_segments)
+                or (self.max_entries and retained > self.max_entries)
+            )
+            newest_ts = self._timestamps[next_first - 1 - self._base_seq] if next_first > self._base_seq else 0.0
+            too_old = cutoff is not None and newest_ts < cutoff
+            if not (too_many or too_old):
+                break
+            self._drop_oldest_segment()
+
+    def _drop_oldest_segment(self):
+        first_seq = self._segments.pop(0)
+        new_base = self._segments[0]
+        dropped = new_base - self._base_seq
+
+        del self._timestamps[:dropped]
+        del self._offsets[:dropped]
+        del self._action_codes[:dropped]
+        self._base_seq = new_base
+
+        for index in (self._by_device, self._by_action):
+            for key in list(index):
+                seqs = index[key]
+                cut = bisect_left(seqs, new_base)
+                if cut == len(seqs):
+                    del index[key]
+                elif cut:
+                    del seqs[:cut]
+
+        self._close_reader(first_seq)
+        try:
+            self._segment_path(first_seq).unlink()
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def _close_reader(self, first_seq: int):
+        reader = self._readers.pop(first_seq, None)
+        if reader:
+            reader.close()
+
+    def _read(self, seq: int) -> dict:
+        first_seq = self._segments[bisect_right(self._segments, seq) - 1]
+        reader = self._readers.get(first_seq)
+        if reader is None:
+            if len(self._readers) >= MAX_OPEN_READERS:
+                self._readers.popitem(last=False)[1].close()
+            reader = open(self._segment_path(first_seq), "rb")
+            self._readers[first_seq] = reader
+        else:
+            self._readers.move_to_end(first_seq)
+        reader.seek(self._offsets[seq - self._base_seq])
+        return json.loads(reader.readline())
+
+    def _seq_bounds(self, since: Optional[datetime], until: Optional[datetime]) -> tuple[int, int]:
+        lo, hi = self._base_seq, self._next_seq
+        since_ts, until_ts = to_epoch(since), to_epoch(until)
+        if since_ts is not None:
+            lo = self._base_seq + bisect_left(self._timestamps, since_ts)
+        if until_ts is not None:
+            hi = self._base_seq + bisect_right(self._timestamps, until_ts)
+        return lo, hi
+
+    def _candidates(self, device_id, action, lo: int, hi: int):
+        """Iterate matching seqs within [lo, hi) in ascending order"""
+        if device_id is not None:
+            seqs = self._by_device.get(device_id, array("Q"))
+        elif action is not None:
+            seqs = self._by_action.get(action, array("Q"))
+        else:
+            return range(lo, max(lo, hi))
+
+        view = _SeqSlice(seqs, bisect_left(seqs, lo), bisect_left(seqs, hi))
+        if device_id is not None and action is not None:
+            code = self._action_ids.get(action)
+            if code is None:
+                return ()
+            codes, base = self._action_codes, self._base_seq
+            return (seq for seq in view if codes[seq - base] == code)
+        return view
+
+    def _count(self, device_id, action, lo: int, hi: int) -> int:
+        candidates = self._candidates(device_id, action, lo, hi)
+        if isinstance(candidates, (range, _SeqSlice, tuple)):
+            return len(candidates)
+        return sum(1 for _ in candidates)
+
+    def query(
+        self,
+        device_id: Optional[str] = None,
+        action: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[int] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> dict:
+        """Filter entries (oldest first) and return one page
+
+        ``cursor`` is the ``next_cursor`` of a previous page; it makes the
+        page start right after that entry regardless of how much the log grew.
+        ``total`` always covers the whole filtered window.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            window_lo, hi = self._seq_bounds(since, until)
+            lo = window_lo if cursor is None else max(window_lo, cursor + 1)
+
+            candidates = self._candidates(device_id, action, lo, hi)
+            page_seqs = list(islice(candidates, offset, offset + limit + 1))
+            has_more = len(page_seqs) > limit
+            page_seqs = page_seqs[:limit]
+
+            return {
+                "logs": [self._read(seq) for seq in page_seqs],
+                "total": self._count(device_id, action, window_lo, hi),
+                "next_cursor": page_seqs[-1] if page_seqs and has_more else None,
+            }
+
+    def iter_entries(
+        self,
+        device_id: Optional[str] = None,
+        action: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[int] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[tuple[int, dict]]:
+        """Yield ``(seq, entry)`` for every match, oldest first
+
+        The upper bound is fixed when iteration starts, and entries are read
+        in batches so the lock is never held for the whole scan.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            lo, hi = self._seq_bounds(since, until)
+        if cursor is not None:
+            lo = max(lo, cursor + 1)
+
+        while lo < hi:
+            with self._lock:
+                lo = max(lo, self._base_seq)  # retention may have dropped segments
+                seqs = list(islice(self._candidates(device_id, action, lo, hi), batch_size))
+                batch = [(seq, self._read(seq)) for seq in seqs]
+            if not batch:
+                return
+            yield from batch
+            lo = seqs[-1] + 1
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return self._next_seq - self._base_seq
+
+    def stats(self) -> dict:
+        """Index and on-disk statistics"""
+        with self._lock:
+            self._ensure_loaded()
+            segments = list(self._segments)
+        disk_bytes = 0
+        for first_seq in segments:
+            try:
+                disk_bytes += self._segment_path(first_seq).stat().st_size
+            except OSError:
+                pass
+        return {
+            "entries": self._next_seq - self._base_seq,
+            "segments": len(segments),
+            "oldest_seq": self._base_seq,
+            "next_seq": self._next_seq,
+            "devices_indexed": len(self._by_device),
+            "disk_bytes": disk_bytes,
+        }
+
+    async def run(self, interval: float):
+        """Background task: apply retention even when no rotation happens"""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.apply_retention)
+
+    def close(self):
+        with self._lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+            for first_seq in list(self._readers):
+                self._close_reader(first_seq)
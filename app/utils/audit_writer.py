@@ -0,0 +1,121 @@
+"""Non-blocking audit pipeline
+
+Request handlers call ``record()``, which only appends a tuple to a bounded
+in-memory queue. A background task drains the queue in batches and hands
+them to ``AuditLog.extend`` in a worker thread, so JSON encoding and disk
+writes never run on the event loop.
+"""
+from collections import deque
+from typing import Optional
+import asyncio
+import logging
+import time
+
+from app.utils.audit_log import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Bounded queue + batching background writer for an ``AuditLog``"""
+
+    def __init__(
+        self,
+        audit_log: AuditLog,
+        max_queue_size: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        high_water_ratio: float = 0.8,
+    ):
+        self.audit_log = audit_log
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_water = int(max_queue_size * high_water_ratio)
+
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.backpressure = 0  # records accepted while above the high-water mark
+        self.batches = 0
+        self.write_errors = 0
+
+    def record(
+        self,
+        action: str,
+        device_id: Optional[str],
+        user_id: Optional[str],
+        details: Optional[dict] = None,
+    ) -> bool:
+        """Queue an event; returns False if it was dropped because the queue is full"""
+        queued = len(self._queue)
+        if queued >= self.max_queue_size:
+            self.dropped += 1
+            return False
+        if queued >= self.high_water:
+            self.backpressure += 1
+
+        self._queue.append((action, device_id, user_id, details, time.time()))
+        self.enqueued += 1
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+        return True
+
+    def _take_batch(self) -> list:
+        count = min(len(self._queue), self.batch_size)
+        return [self._queue.popleft() for _ in range(count)]
+
+    async def _write(self, batch: list):
+        try:
+            await asyncio.to_thread(self.audit_log.extend, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            self.write_errors += 1
+            self.dropped += len(batch)
+            logger.error("Failed to persist %d audit events: %s", len(batch), e)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Linger briefly so bursts are written as one batch
+            if len(self._queue) < self.batch_size:
+                await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+
+            while self._queue:
+                await self._write(self._take_batch())
+
+    def start(self):
+        """Start the background writer on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer and persist whatever is still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue:
+            await self._write(self._take_batch())
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "max_queue_size": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "backpressure": self.backpressure,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+            "running": self._task is not None and not self._task.done(),
+        }
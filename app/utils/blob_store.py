@@ -0,0 +1,115 @@
+"""Content-addressed, reference-counted blob store
+
+Blobs live at ``<root>/<sha[:2]>/<sha>``. Each ``files_db`` entry holds one
+reference to its blob, so uploading identical content again only adds
+metadata, and a blob is unlinked when its last reference is released.
+"""
+from typing import Iterable
+import os
+
+
+class BlobStore:
+    """Deduplicating file store keyed by SHA-256"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._refs: dict[str, int] = {}
+        self._sizes: dict[str, int] = {}
+        self.dedup_hits = 0
+
+    def path_for(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def commit(self, staging_path: str, sha256: str, size: int) -> tuple[str, bool]:
+        """Move a fully written staging file into the store
+
+        Returns ``(blob_path, deduplicated)``. When the blob already exists
+        the staging file is discarded and only the reference count changes.
+        Only renames/unlinks happen here, so there's no await between the
+        reference check and the update.
+        """
+        blob_path = self.path_for(sha256)
+        if self._refs.get(sha256):
+            self._refs[sha256] += 1
+            self.dedup_hits += 1
+            try:
+                os.remove(staging_path)
+            except OSError:
+                pass
+            return blob_path, True
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        os.replace(staging_path, blob_path)
+        self._refs[sha256] = 1
+        self._sizes[sha256] = size
+        return blob_path, False
+
+    def owns(self, sha256: str, path: str) -> bool:
+        """Whether ``path`` is the stored blob for ``sha256``"""
+        return bool(sha256) and sha256 in self._refs and path == self.path_for(sha256)
+
+    def release(self, sha256: str) -> bool:
+        """Drop one reference; returns True if the blob was unlinked"""
+        count = self._refs.get(sha256)
+        if not count:
+            return False
+        if count > 1:
+            self._refs[sha256] = count - 1
+            return False
+
+        del self._refs[sha256]
+        self._sizes.pop(sha256, None)
+        try:
+            os.remove(self.path_for(sha256))
+        except OSError:
+            pass
+        return True
+
+    def rebuild(self, files: Iterable[dict]):
+        """Recompute reference counts from file metadata (e.g. after a restore)"""
+        self._refs.clear()
+        self._sizes.clear()
+        for file_info in files:
+            sha256 = file_info.get("sha256")
+            if sha256 and file_info.get("file_path") == self.path_for(sha256):
+                self._refs[sha256] = self._refs.get(sha256, 0) + 1
+                self._sizes[sha256] = file_info.get("size_bytes", 0)
+
+    def sweep(self) -> int:
+        """Unlink blob files with no reference; returns how many were removed
+
+        Run after ``rebuild``: blobs committed after the last snapshot have
+        no metadata left to reference them and would otherwise stay forever.
+        """
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name in self._refs and entry.path == self.path_for(entry.name):
+                    continue
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+            try:
+                os.rmdir(prefix.path)  # only succeeds once empty
+            except OSError:
+                pass
+        return removed
+
+    def stats(self) -> dict:
+        physical = sum(self._sizes.values())
+        logical = sum(self._sizes[sha] * count for sha, count in self._refs.items())
+        references = sum(self._refs.values())
+        return {
+            "blobs": len(self._refs),
+            "references": references,
+            "logical_bytes": logical,
+            "physical_bytes": physical,
+            "dedup_ratio": round(logical / physical, 4) if physical else 1.0,
+            "dedup_hits": self.dedup_hits,
+        }
@@ -0,0 +1,77 @@
+"""Streaming NDJSON / CSV export helpers
+
+Rows are produced by a generator and encoded in small batches, so an export
+holds at most one batch in memory no matter how many rows it covers. Every
+row carries a ``cursor``; passing the last one seen back to the endpoint
+resumes an interrupted export right after that row.
+"""
+from datetime import datetime
+from typing import Iterable, Iterator
+import csv
+import io
+import json
+
+from fastapi.responses import StreamingResponse
+
+EXPORT_FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+BATCH_ROWS = 500
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), default=_default)
+    return value
+
+
+def iter_ndjson(rows: Iterable[dict]) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON, batching writes"""
+    batch = []
+    for row in rows:
+        batch.append(json.dumps(row, separators=(",", ":"), default=_default))
+        if len(batch) >= BATCH_ROWS:
+            yield ("\n".join(batch) + "\n").encode()
+            batch.clear()
+    if batch:
+        yield ("\n".join(batch) + "\n").encode()
+
+
+def iter_csv(rows: Iterable[dict], columns: list[str]) -> Iterator[bytes]:
+    """Encode rows as CSV with a header line, batching writes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_cell(row.get(column)) for column in columns])
+        count += 1
+        if count >= BATCH_ROWS:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def export_response(rows: Iterable[dict], fmt: str, columns: list[str], name: str) -> StreamingResponse:
+    """Stream ``rows`` as an NDJSON or CSV attachment"""
+    body = iter_csv(rows, columns) if fmt == "csv" else iter_ndjson(rows)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    )
@@ -0,0 +1,110 @@
+"""JSON responses for trusted, already-shaped data
+
+List endpoints build their rows as plain dicts with exactly the fields of
+the documented response model, so there is nothing to validate: the rows go
+straight to the encoder. ``orjson`` is used when it is installed (optional;
+``pip install orjson``), otherwise the standard library encoder with
+compact separators.
+
+Routes keep their ``response_model`` for the OpenAPI schema; returning a
+``Response`` makes FastAPI skip validating and re-encoding the body.
+
+Large arrays can be streamed: ``iter_json`` accepts a dict whose values may
+be row iterators and encodes those in batches, so a page of 10k rows never
+sits in memory as one string.
+"""
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, Mapping, Optional
+import json
+
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+BATCH_ROWS = 500
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+    def dumps(value: Any) -> bytes:
+        return _encoder.encode(value).encode()
+
+
+def _iter_array(rows: Iterable, batch_rows: int) -> Iterator[bytes]:
+    yield b"["
+    separator = b""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            # One encoder call per batch; drop the batch's own brackets
+            yield separator + dumps(batch)[1:-1]
+            separator = b","
+            batch.clear()
+    if batch:
+        yield separator + dumps(batch)[1:-1]
+    yield b"]"
+
+
+def _is_rows(value: Any) -> bool:
+    return isinstance(value, (list, tuple, Iterator))
+
+
+def iter_json(document: Any, batch_rows: int = BATCH_ROWS) -> Iterator[bytes]:
+    """Encode ``document`` incrementally: a top-level list/iterator, or any
+    list/iterator value of a top-level dict, is emitted as an array
+    ``batch_rows`` rows at a time"""
+    if _is_rows(document):
+        yield from _iter_array(document, batch_rows)
+        return
+    if not isinstance(document, Mapping):
+        yield dumps(document)
+        return
+    yield b"{"
+    for index, (key, value) in enumerate(document.items()):
+        yield (b"," if index else b"") + dumps(key) + b":"
+        if _is_rows(value):
+            yield from _iter_array(value, batch_rows)
+        else:
+            yield dumps(value)
+    yield b"}"
+
+
+class FastJSONResponse(Response):
+    """``JSONResponse`` without the per-row validation and with ``dumps``"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(
+    document: Any,
+    rows: int = 0,
+    stream_min_rows: Optional[int] = None,
+    status_code: int = 200,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """Encode ``document`` in one go, or stream it when it holds more than
+    ``stream_min_rows`` rows"""
+    if stream_min_rows is not None and rows > stream_min_rows:
+        return StreamingResponse(
+            iter_json(document), status_code=status_code, headers=headers, media_type="application/json"
+        )
+    return FastJSONResponse(document, status_code=status_code, headers=headers)
@@ -0,0 +1,153 @@
+"""Chunked, non-blocking file writes for uploads"""
+from typing import AsyncIterator, Optional
+import hashlib
+import os
+import uuid
+
+import aiofiles
+import aiofiles.os
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+class FileTooLargeError(Exception):
+    """Raised when a stream exceeds the allowed size"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class MultipartError(ValueError):
+    """Raised when a multipart body is malformed or lacks the file field"""
+
+
+class MultipartFileStream:
+    """Pull one file field out of a ``multipart/form-data`` request body
+
+    The body is fed to python-multipart's push parser as it arrives, so the
+    file's bytes reach the caller (size check, hashing, disk) without
+    Starlette first spooling the whole request to a temp file. Other fields
+    are skipped; ``filename`` is set once the field's headers are parsed.
+    """
+
+    def __init__(self, body: AsyncIterator[bytes], content_type: str, field_name: str = "file"):
+        media_type, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise MultipartError("Expected a multipart/form-data body")
+        self.body = body
+        self.field_name = field_name.encode()
+        self.filename = None
+        self.found = False
+
+        self._pending: list[bytes] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._in_field = False
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._disposition = b""
+        self._in_field = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if options.get(b"name") == self.field_name and b"filename" in options and not self.found:
+            self._in_field = self.found = True
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_field:
+            self._pending.append(data[start:end])
+
+    def _on_part_end(self):
+        self._in_field = False
+
+    def _feed(self, chunk: Optional[bytes]):
+        try:
+            if chunk is None:
+                self._parser.finalize()
+            else:
+                self._parser.write(chunk)
+        except Exception as e:
+            raise MultipartError(f"Malformed multipart body: {e}") from e
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Yield the file field's bytes as the request body arrives"""
+        async for chunk in self.body:
+            self._feed(chunk)
+            if self._pending:
+                pending, self._pending = self._pending, []
+                for piece in pending:
+                    yield piece
+        self._feed(None)
+        for piece in self._pending:
+            yield piece
+        self._pending = []
+        if not self.found:
+            raise MultipartError(f"Missing file field '{self.field_name.decode()}'")
+
+
+def safe_filename(filename: str) -> str:
+    """Strip any client-supplied directory components"""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    return name or "upload"
+
+
+async def write_stream(chunks: AsyncIterator[bytes], dest_path: str, max_bytes: int) -> tuple[int, str]:
+    """Write ``chunks`` to ``dest_path`` and return ``(size, sha256 hex)``
+
+    Data goes to a temp file next to the destination, the size limit is
+    checked as each chunk arrives, and the file is renamed into place only
+    once it is complete, so readers never see a partial file.
+    """
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex[:8]}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+        await aiofiles.os.replace(tmp_path, dest_path)
+    except BaseException:
+        try:
+            await aiofiles.os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return size, digest.hexdigest()
+
+
+async def iter_files(paths: list[str], chunk_size: int) -> AsyncIterator[bytes]:
+    """Iterate the concatenated contents of ``paths`` in chunks"""
+    for path in paths:
+        async with aiofiles.open(path, "rb") as f:
+            while True:
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
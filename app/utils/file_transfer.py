@@ -0,0 +1,347 @@
+"""Push stored files to desktop agents over their WebSocket
+
+Protocol (server -> desktop):
+
+* ``{"type": "file_transfer_start", "transfer_id", "file_id", "filename",
+  "size_bytes", "sha256", "offset", "chunk_size"}``
+* binary frames: ``FRAME_HEADER`` (transfer_id, seq, offset) + chunk data
+* ``{"type": "file_transfer_complete", "transfer_id", "size_bytes", "sha256"}``
+
+Desktop -> server:
+
+* ``{"type": "file_transfer_ack", "transfer_id", "offset"}`` - bytes received
+  contiguously so far; the sender keeps at most ``window_bytes`` unacked
+* ``{"type": "file_transfer_resume", "transfer_id", "offset"}`` - restart
+  sending from ``offset``
+* ``{"type": "file_transfer_error", "transfer_id", "error"}`` - give up
+
+Transfers for offline devices stay queued and restart from the last acked
+offset once the device reconnects. If a connected desktop stops acking, the
+transfer is retried on the same socket with exponential backoff and failed
+after ``MAX_TRANSFER_ATTEMPTS`` stalls, so one stuck file (or an agent that
+doesn't speak this protocol) can't block the device's queue for good.
+Chunks are sliced out of a memory map of the stored blob, so at most one
+chunk per device is buffered in Python.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Optional
+import asyncio
+import logging
+import mmap
+import struct
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# transfer_id (16 ascii bytes), chunk sequence number, byte offset
+FRAME_HEADER = struct.Struct("!16sIQ")
+
+MAX_ACK_TIMEOUTS = 3
+
+# After an ack stall the head transfer is retried on the same socket after
+# this delay (doubling up to the cap), or sooner if the desktop sends
+# ack/resume/error for it
+RETRY_BACKOFF_SECONDS = 5.0
+MAX_RETRY_BACKOFF_SECONDS = 120.0
+# Stalled attempts (counted across reconnects) before a transfer is failed
+MAX_TRANSFER_ATTEMPTS = 4
+
+
+class _ByteRateLimiter:
+    """Token bucket over bytes per second (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def consume(self, amount: int):
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class FileTransferManager:
+    """Per-device transfer queues and sender tasks"""
+
+    def __init__(
+        self,
+        chunk_size: int = 64 * 1024,
+        window_bytes: int = 1024 * 1024,
+        bandwidth_bytes_per_sec: float = 0,
+        ack_timeout: float = 15.0,
+    ):
+        self.chunk_size = chunk_size
+        self.window_bytes = max(window_bytes, chunk_size)
+        self.bandwidth_bytes_per_sec = bandwidth_bytes_per_sec
+        self.ack_timeout = ack_timeout
+
+        self._queues: dict[str, deque] = {}
+        self._senders: dict[str, tuple] = {}  # device_id -> (websocket, task)
+        self._events: dict[str, asyncio.Event] = {}
+        self._limiters: dict[str, _ByteRateLimiter] = {}
+
+        self.bytes_sent = 0
+        self.completed = 0
+        self.failed = 0
+
+    # ------------------------------------------------------------------
+    # Queue management
+    # ------------------------------------------------------------------
+
+    def _event(self, device_id: str) -> asyncio.Event:
+        event = self._events.get(device_id)
+        if event is None:
+            event = self._events[device_id] = asyncio.Event()
+        return event
+
+    def enqueue(self, device_id: str, file_info: dict) -> dict:
+        """Queue a stored file for delivery to ``device_id``"""
+        transfer = {
+            "transfer_id": f"xfer_{uuid.uuid4().hex[:11]}",
+            "device_id": device_id,
+            "file_id": file_info["file_id"],
+            "filename": file_info["filename"],
+            "size_bytes": file_info["size_bytes"],
+            "sha256": file_info.get("sha256"),
+            "path": file_info["file_path"],
+            "acked_offset": 0,
+            "status": "queued",
+            "created_at": datetime.utcnow(),
+        }
+        self._queues.setdefault(device_id, deque()).append(transfer)
+        self._event(device_id).set()
+        return transfer
+
+    def cancel_file(self, file_id: str):
+        """Drop queued transfers of a deleted file"""
+        for queue in self._queues.values():
+            for transfer in list(queue):
+                if transfer["file_id"] == file_id and transfer["status"] == "queued":
+                    queue.remove(transfer)
+
+    def pending(self, device_id: Optional[str] = None) -> list[dict]:
+        queues = [self._queues.get(device_id, ())] if device_id else self._queues.values()
+        return [
+            {key: value for key, value in transfer.items() if key != "path"}
+            for queue in queues for transfer in queue
+        ]
+
+    def export_queues(self) -> dict:
+        """``device_id -> [transfer]`` for snapshots"""
+        return {device_id: list(queue) for device_id, queue in self._queues.items() if queue}
+
+    def restore_queues(self, queues: dict, known_file_ids=None):
+        """Reload queues from a snapshot; in-flight transfers resume from their acked offset"""
+        self._queues.clear()
+        for device_id, transfers in queues.items():
+            queue = deque(
+                {**transfer, "status": "queued"} for transfer in transfers
+                if known_file_ids is None or transfer["file_id"] in known_file_ids
+            )
+            if queue:
+                self._queues[device_id] = queue
+
+    def _current(self, device_id: str, transfer_id: str) -> Optional[dict]:
+        queue = self._queues.get(device_id)
+        if queue and queue[0]["transfer_id"] == transfer_id:
+            return queue[0]
+        return None
+
+    # ------------------------------------------------------------------
+    # Connection lifecycle
+    # ------------------------------------------------------------------
+
+    def attach(self, device_id: str, websocket):
+        """Start delivering queued files over a newly connected socket"""
+        previous = self._senders.pop(device_id, None)
+        if previous:
+            previous[1].cancel()
+        task = asyncio.create_task(self._sender(device_id, websocket))
+        self._senders[device_id] = (websocket, task)
+
+    def detach(self, device_id: str, websocket):
+        """Stop the sender if it still belongs to ``websocket``"""
+        sender = self._senders.get(device_id)
+        if sender and sender[0] is websocket:
+            del self._senders[device_id]
+            sender[1].cancel()
+
+    def handle_message(self, device_id: str, message: dict):
+        """Apply an ack/resume/error message from the desktop"""
+        transfer = self._current(device_id, message.get("transfer_id"))
+        if transfer is None:
+            return
+
+        message_type = message.get("type")
+        if message_type == "file_transfer_error":
+            transfer["status"] = "failed"
+            transfer["error"] = message.get("error", "Unknown error")
+        else:
+            offset = message.get("offset")
+            if not isinstance(offset, int) or not 0 <= offset <= transfer["size_bytes"]:
+                return
+            if message_type == "file_transfer_resume":
+                transfer["acked_offset"] = offset
+                transfer["resume"] = True
+            elif offset > transfer["acked_offset"]:
+                transfer["acked_offset"] = offset
+        self._event(device_id).set()
+
+    # ------------------------------------------------------------------
+    # Sending
+    # ------------------------------------------------------------------
+
+    def _owns(self, device_id: str, websocket) -> bool:
+        sender = self._senders.get(device_id)
+        return sender is not None and sender[0] is websocket
+
+    async def _sender(self, device_id: str, websocket):
+        event = self._event(device_id)
+        backoff = RETRY_BACKOFF_SECONDS
+        try:
+            # Ownership is re-checked because a cancel can be swallowed by
+            # wait_for() when it races with an ack
+            while self._owns(device_id, websocket):
+                queue = self._queues.get(device_id)
+                if not queue:
+                    event.clear()
+                    await event.wait()
+                    continue
+
+                transfer = queue[0]
+                start_offset = transfer["acked_offset"]
+                sent = await self._send_transfer(device_id, websocket, transfer)
+                if not sent and transfer["status"] != "failed":
+                    # Only attempts that made no progress at all count
+                    if transfer["acked_offset"] > start_offset:
+                        transfer["attempts"] = 0
+                    transfer["attempts"] = transfer.get("attempts", 0) + 1
+                    if transfer["attempts"] >= MAX_TRANSFER_ATTEMPTS:
+                        transfer["status"] = "failed"
+                        transfer["error"] = f"No acknowledgement after {transfer['attempts']} attempts"
+                    else:
+                        # Desktop stopped acking but the socket is still up:
+                        # back off, then resume from the acked offset (a
+                        # reconnect replaces this sender anyway)
+                        transfer["status"] = "queued"
+                        logger.warning("File transfer %s to %s stalled; retrying in %.0fs",
+                                       transfer["transfer_id"], device_id, backoff)
+                        event.clear()
+                        try:
+                            await asyncio.wait_for(event.wait(), timeout=backoff)
+                        except asyncio.TimeoutError:
+                            pass
+                        backoff = min(backoff * 2, MAX_RETRY_BACKOFF_SECONDS)
+                        continue
+                backoff = RETRY_BACKOFF_SECONDS
+                queue.popleft()
+                if transfer["status"] == "completed":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                    logger.warning("File transfer %s to %s failed: %s", transfer["transfer_id"], device_id, transfer.get("error"))
+                if not queue:
+                    self._queues.pop(device_id, None)
+        except Exception as e:
+            logger.error("File transfer sender for %s stopped: %s", device_id, e)
+        finally:
+            # Whatever was in flight resumes from its acked offset next time,
+            # unless a newer connection's sender has already taken it over
+            queue = self._queues.get(device_id)
+            replaced = device_id in self._senders and not self._owns(device_id, websocket)
+            if queue and queue[0]["status"] == "sending" and not replaced:
+                queue[0]["status"] = "queued"
+
+    async def _send_transfer(self, device_id: str, websocket, transfer: dict) -> bool:
+        """Send one file; returns False if the desktop stopped acknowledging"""
+        transfer["status"] = "sending"
+        size = transfer["size_bytes"]
+        transfer_key = transfer["transfer_id"].encode().ljust(16)[:16]
+        limiter = self._limiters.setdefault(device_id, _ByteRateLimiter(self.bandwidth_bytes_per_sec))
+        event = self._event(device_id)
+
+        await websocket.send_json({
+            "type": "file_transfer_start",
+            "transfer_id": transfer["transfer_id"],
+            "file_id": transfer["file_id"],
+            "filename": transfer["filename"],
+            "size_bytes": size,
+            "sha256": transfer["sha256"],
+            "offset": transfer["acked_offset"],
+            "chunk_size": self.chunk_size,
+        })
+
+        try:
+            f = open(transfer["path"], "rb")
+        except OSError as e:
+            transfer["status"] = "failed"
+            transfer["error"] = str(e)
+            return False
+
+        with f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            try:
+                sent = transfer["acked_offset"]
+                seq = 0
+                timeouts = 0
+                while transfer["acked_offset"] < size:
+                    if not self._owns(device_id, websocket):
+                        raise asyncio.CancelledError()
+                    if transfer["status"] == "failed":
+                        return False
+                    if transfer.pop("resume", False):
+                        sent = transfer["acked_offset"]
+
+                    if sent >= size or sent - transfer["acked_offset"] >= self.window_bytes:
+                        event.clear()
+                        acked = transfer["acked_offset"]
+                        try:
+                            await asyncio.wait_for(event.wait(), timeout=self.ack_timeout)
+                        except asyncio.TimeoutError:
+                            if transfer["acked_offset"] == acked:
+                                timeouts += 1
+                                if timeouts >= MAX_ACK_TIMEOUTS:
+                                    return False
+                                sent = transfer["acked_offset"]  # go back and resend
+                        else:
+                            timeouts = 0
+                        continue
+
+                    length = min(self.chunk_size, size - sent)
+                    await limiter.consume(length)
+                    await websocket.send_bytes(
+                        FRAME_HEADER.pack(transfer_key, seq, sent) + mapped[sent:sent + length]
+                    )
+                    self.bytes_sent += length
+                    sent += length
+                    seq += 1
+            finally:
+                if mapped is not None:
+                    mapped.close()
+
+        transfer["status"] = "completed"
+        await websocket.send_json({
+            "type": "file_transfer_complete",
+            "transfer_id": transfer["transfer_id"],
+            "size_bytes": size,
+            "sha256": transfer["sha256"],
+        })
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "queued_transfers": sum(len(queue) for queue in self._queues.values()),
+            "devices_with_queue": len(self._queues),
+            "active_senders": len(self._senders),
+            "bytes_sent": self.bytes_sent,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,282 @@
+"""Cache-aware file responses: ETag/Last-Modified validators, byte ranges
+and on-the-fly gzip for compressible content types"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+import codecs
+import mimetypes
+import uuid
+import zlib
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+READ_CHUNK_SIZE = 64 * 1024
+GZIP_MIN_SIZE = 1024
+MAX_RANGES = 16
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/x-ndjson",
+    "application/x-yaml",
+    "image/svg+xml",
+}
+
+# (magic prefix, content type) for files whose name gives no useful hint
+MAGIC_NUMBERS = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+    (b"\x1f\x8b", "application/gzip"),
+]
+
+
+class RangeNotSatisfiable(Exception):
+    """The Range header can't be served for this file"""
+
+
+def detect_content_type(filename: str, head: bytes) -> str:
+    """Guess a content type from the filename, falling back to magic bytes"""
+    content_type, _ = mimetypes.guess_type(filename)
+    if content_type:
+        return content_type
+    for magic, magic_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return magic_type
+    if not head or b"\x00" in head:
+        return "application/octet-stream"
+    try:
+        # ``final=False`` tolerates a multi-byte character cut off at the end
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "text/plain"
+    except UnicodeDecodeError:
+        return "application/octet-stream"
+
+
+def is_compressible(content_type: str) -> bool:
+    base = content_type.split(";", 1)[0].strip()
+    return base.startswith("text/") or base in COMPRESSIBLE_TYPES or base.endswith("+json")
+
+
+def _http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison as required for If-None-Match"""
+    if header.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        since = _parse_http_date(if_modified_since)
+        if since is not None:
+            modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+            return modified <= since
+    return False
+
+
+def parse_range(header: str, size: int) -> list[tuple[int, int]]:
+    """Parse ``bytes=`` ranges into inclusive ``(start, end)`` pairs"""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        raise RangeNotSatisfiable()
+
+    ranges = []
+    for part in spec.split(","):
+        start_text, dash, end_text = part.strip().partition("-")
+        if not dash:
+            raise RangeNotSatisfiable()
+        try:
+            if start_text == "":
+                # Suffix range: the last N bytes
+                length = int(end_text)
+                if length <= 0:
+                    continue
+                start, end = max(0, size - length), size - 1
+            else:
+                start = int(start_text)
+                end = int(end_text) if end_text else size - 1
+        except ValueError:
+            raise RangeNotSatisfiable()
+        if start > end or start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    if not ranges or len(ranges) > MAX_RANGES:
+        raise RangeNotSatisfiable()
+
+    # Coalesce overlapping/adjacent ranges
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _range_applies(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Honour If-Range: only serve a partial body if the validator still matches"""
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range.strip() == etag and not etag.startswith("W/")
+    since = _parse_http_date(if_range)
+    return since is not None and last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+async def _read_range(path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _read_gzip(path: str) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    async with aiofiles.open(path, "rb") as f:
+        while True:
+            chunk = await f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+    yield compressor.flush()
+
+
+async def _read_multipart(path: str, ranges: list, boundary: str, content_type: str, size: int) -> AsyncIterator[bytes]:
+    for start, end in ranges:
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        async for chunk in _read_range(path, start, end):
+            yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def _content_disposition(filename: str) -> str:
+    try:
+        filename.encode("ascii")
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def file_response(
+    request: Request,
+    path: str,
+    filename: str,
+    size: int,
+    content_type: str,
+    last_modified: datetime,
+    sha256: Optional[str] = None,
+) -> Response:
+    """Build a 200/206/304/416 response for a stored file"""
+    accepts_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    range_header = request.headers.get("range")
+    gzip_body = (
+        accepts_gzip and not range_header
+        and size >= GZIP_MIN_SIZE and is_compressible(content_type)
+    )
+
+    # Strong ETag from the content hash; the gzip variant gets its own tag
+    if sha256:
+        etag = f'"{sha256}-gzip"' if gzip_body else f'"{sha256}"'
+    else:
+        etag = f'W/"{size:x}-{int(last_modified.timestamp()):x}"'
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": _http_date(last_modified),
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+    }
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = _content_disposition(filename)
+
+    if range_header and _range_applies(request, etag, last_modified):
+        try:
+            ranges = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _read_range(path, start, end),
+                status_code=206,
+                media_type=content_type,
+                headers=headers
+            )
+
+        boundary = uuid.uuid4().hex
+        return StreamingResponse(
+            _read_multipart(path, ranges, boundary, content_type, size),
+            status_code=206,
+            media_type=f"multipart/byteranges; boundary={boundary}",
+            headers=headers
+        )
+
+    if gzip_body:
+        headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(_read_gzip(path), media_type=content_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    if size == 0:
+        return Response(content=b"", media_type=content_type, headers=headers)
+    return StreamingResponse(_read_range(path, 0, size - 1), media_type=content_type, headers=headers)
@@ -0,0 +1,184 @@
+"""Non-blocking logging: bounded queue, writer thread, JSON records
+
+Callers only run the filters and a ``put_nowait``; formatting and the actual
+write happen on a ``QueueListener`` thread, so a slow stdout can never stall
+the event loop. When the queue is full records are dropped (and counted)
+rather than waited on.
+
+High-volume events are tagged with ``extra={"event": "<name>"}`` and can be
+thinned out before they reach the queue:
+
+* ``SamplingFilter`` keeps every Nth record of an event (rate ``1/N``)
+* ``EventRateLimitFilter`` caps records per second per event and reports
+  how many were suppressed on the next record that gets through
+"""
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["DropOnFullQueueHandler"] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DropOnFullQueueHandler(QueueHandler):
+    """QueueHandler that never blocks and never formats on the caller's thread"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class formats the message here; leave that to the writer
+        # thread (args are rendered there, so log values, not live objects)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in ``round(1 / rate)`` records per event"""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.every = {event: max(1, round(1 / rate)) if rate > 0 else 0 for event, rate in rates.items()}
+        self._seen: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None:
+            return True
+        every = self.every.get(event)
+        if every is None:
+            return True
+        if every == 0:
+            return False
+        seen = self._seen.get(event, 0)
+        self._seen[event] = seen + 1
+        if seen % every:
+            return False
+        record.sample_rate = 1 / every
+        return True
+
+
+class EventRateLimitFilter(logging.Filter):
+    """At most ``limits[event]`` records per second for each event"""
+
+    def __init__(self, limits: dict[str, float]):
+        super().__init__()
+        self.limits = limits
+        self._windows: dict[str, list] = {}  # event -> [window_start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        limit = self.limits.get(event) if event is not None else None
+        if limit is None:
+            return True
+
+        now = time.monotonic()
+        window = self._windows.get(event)
+        if window is None or now - window[0] >= 1.0:
+            suppressed = window[2] if window else 0
+            window = self._windows[event] = [now, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+        if window[1] >= limit:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+def configure_logging(
+    level: str = "INFO",
+    fmt: str = "json",
+    queue_size: int = 10000,
+    sample_rates: Optional[dict] = None,
+    rate_limits: Optional[dict] = None,
+    stream=None,
+) -> DropOnFullQueueHandler:
+    """Route the root logger (and uvicorn's loggers) through the queue"""
+    global _listener, _queue_handler
+    shutdown_logging()
+
+    if fmt == "json":
+        formatter: logging.Formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    handler = DropOnFullQueueHandler(log_queue)
+    if sample_rates:
+        handler.addFilter(SamplingFilter(sample_rates))
+    if rate_limits:
+        handler.addFilter(EventRateLimitFilter(rate_limits))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    # uvicorn installs its own synchronous stream handlers; send its records
+    # (including the per-request access log) through the queue as well
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    _queue_handler = handler
+    return handler
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_pipeline_stats() -> dict:
+    if _queue_handler is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+    }
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,243 @@
+"""Minimal Prometheus instrumentation (text exposition format 0.0.4)
+
+Counters and histograms are plain Python objects: a labelled child is looked
+up once and then updated with a couple of additions, so they can sit on the
+per-message relay path. Anything that is already a number somewhere (store
+sizes, queue depths, component stats) is a ``CallbackMetric`` read only when
+``/metrics`` is scraped.
+"""
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+_registry: list = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict = {}
+        _registry.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, child in self._children.items():
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: tuple):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)  # last slot: +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                labels = _label_text(self.labelnames, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """Gauge (or counter) whose samples are computed at scrape time
+
+    ``callback`` returns a number, or a ``{label_values_tuple: number}`` dict
+    for labelled metrics.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable,
+                 labelnames: Iterable[str] = (), type: str = "gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        samples = self.callback()
+        if not isinstance(samples, dict):
+            samples = {(): samples}
+        for values, value in samples.items():
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------------------------------------------------
+# Metrics shared across routers
+# ----------------------------------------------------------------------
+
+WS_MESSAGES = Counter(
+    "antigravity_ws_messages_total", "Inbound WebSocket messages by type", ["type"]
+)
+WS_RELAY_SECONDS = Histogram(
+    "antigravity_ws_relay_seconds", "Time to fan a message out to all mobiles", ["kind"]
+)
+WS_SEND_FAILURES = Counter(
+    "antigravity_ws_send_failures_total", "Failed WebSocket sends", ["kind"]
+)
+DESKTOP_RPC_SECONDS = Histogram(
+    "antigravity_desktop_rpc_seconds", "Desktop request round-trip time", ["method"]
+)
+DESKTOP_RPC_TIMEOUTS = Counter(
+    "antigravity_desktop_rpc_timeouts_total", "Desktop requests that timed out", ["method"]
+)
+COMMAND_DURATION_SECONDS = Histogram(
+    "antigravity_command_duration_seconds",
+    "Seconds from command creation to first output / final outcome",
+    ["stage"],
+    buckets=DURATION_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "antigravity_http_request_seconds", "HTTP request latency by route", ["method", "route"]
+)
+HTTP_RESPONSES = Counter(
+    "antigravity_http_responses_total", "HTTP responses by route and status", ["method", "route", "status"]
+)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware timing HTTP requests per route template
+
+    Uses the matched route's path (``/api/v1/commands/{command_id}``), never
+    the raw URL, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, exclude_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path: Optional[str] = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.labels(method, route_path).observe(time.perf_counter() - start)
+            HTTP_RESPONSES.labels(method, route_path, str(status_code)).inc()
@@ -0,0 +1,103 @@
+"""One-time pairing codes with TTL expiry
+
+Codes sit in a dict for O(1) lookup plus a heap ordered by expiry, so the
+sweeper only ever looks at codes that are actually due. Used codes are kept
+until they expire (to answer "already used"), and ``max_codes`` caps the
+table during a burst by evicting the codes closest to expiry.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import heapq
+import logging
+import time
+
+from app.utils.security import generate_pairing_code
+
+logger = logging.getLogger(__name__)
+
+
+class PairingCodeStore:
+    """``code -> {code, user_id, expires_at, used}`` with an expiry heap"""
+
+    def __init__(self, ttl_seconds: float = 600.0, max_codes: int = 100_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_codes = max_codes
+        self._codes: dict[str, dict] = {}
+        self._heap: list[tuple[float, str]] = []
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def create(self, user_id: Optional[str] = None) -> dict:
+        """Issue a fresh code, optionally owned by ``user_id``"""
+        code = generate_pairing_code()
+        while code in self._codes:
+            code = generate_pairing_code()
+
+        deadline = time.time() + self.ttl_seconds
+        entry = {
+            "code": code,
+            "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+            "used": False,
+            # The device paired with this code joins the generating user's list
+            "user_id": user_id,
+            "deadline": deadline,
+        }
+        self._codes[code] = entry
+        heapq.heappush(self._heap, (deadline, code))
+        self.created += 1
+
+        while len(self._codes) > self.max_codes:
+            _, oldest = heapq.heappop(self._heap)
+            if self._codes.pop(oldest, None) is not None:
+                self.evicted += 1
+        return entry
+
+    def get(self, code: str) -> Optional[dict]:
+        """Return the entry (possibly used or expired but not yet swept)"""
+        return self._codes.get(code)
+
+    def entries(self) -> dict:
+        """Live ``code -> entry`` mapping (for snapshots; don't mutate)"""
+        return self._codes
+
+    def load(self, entries: dict):
+        """Replace all codes (e.g. from a snapshot) and rebuild the heap"""
+        now = time.time()
+        self._codes = {code: entry for code, entry in entries.items() if entry["deadline"] > now}
+        self._heap = [(entry["deadline"], code) for code, entry in self._codes.items()]
+        heapq.heapify(self._heap)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop codes past their deadline"""
+        now = time.time() if now is None else now
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            deadline, code = heapq.heappop(self._heap)
+            entry = self._codes.get(code)
+            if entry is not None and entry["deadline"] == deadline:
+                del self._codes[code]
+                removed += 1
+        self.expired += removed
+        return removed
+
+    async def run(self, interval: float):
+        """Background task: sweep expired codes"""
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.sweep()
+            if removed:
+                logger.debug("Swept %d expired pairing codes", removed)
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self._codes),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,105 @@
+"""Password hashing off the event loop
+
+``hashlib.scrypt`` and ``hashlib.pbkdf2_hmac`` release the GIL while they
+run, so a small thread pool gives real parallelism without the pickling and
+start-up cost of a process pool. A semaphore caps concurrent hashes; callers
+that can't get a slot within ``queue_timeout`` get ``HashingBusyError``
+instead of piling up behind a login burst.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import secrets
+import time
+
+from app.utils.security import get_password_hash, verify_password
+
+
+class HashingBusyError(Exception):
+    """No hashing slot became free within the queue timeout"""
+
+
+class PasswordHasher:
+    """Bounded async front-end for the password KDF"""
+
+    def __init__(self, workers: int = 4, max_concurrency: int = 4, queue_timeout: float = 5.0):
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dummy_hash: Optional[str] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.completed = 0
+        self.rejected = 0
+        self.waiting = 0
+        self._latencies: deque = deque(maxlen=1000)  # seconds, most recent hashes
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HashingBusyError()
+        finally:
+            self.waiting -= 1
+
+        try:
+            start = time.perf_counter()
+            result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+            self._latencies.append(time.perf_counter() - start)
+            self.completed += 1
+            return result
+        finally:
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    def _verify_dummy(self, password: str) -> bool:
+        # Built on first use (in the pool) so importing the app stays cheap
+        if self._dummy_hash is None:
+            self._dummy_hash = get_password_hash(secrets.token_hex(16))
+        verify_password(password, self._dummy_hash)
+        return False
+
+    async def verify_dummy(self, password: str) -> bool:
+        """Spend one full KDF run and return False
+
+        Used for unknown accounts so a login takes as long as one with a
+        wrong password, instead of revealing which emails exist.
+        """
+        return await self._run(self._verify_dummy, password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(q: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+
+        return {
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "latency_ms_p50": percentile(0.5),
+            "latency_ms_p99": percentile(0.99),
+            "latency_ms_max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
@@ -1,10 +1,20 @@
-import qrcode
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from typing import Optional
+import asyncio
 import base64
 
+from app.config import settings
+
+QR_FORMATS = ("png", "svg")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _build_qr(data: str):
+    # qrcode (and Pillow behind it) is only needed once someone pairs
+    import qrcode
 
-def generate_qr_code(data: str) -> str:
-    """Generate a QR code and return as base64 encoded image"""
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
@@ -13,12 +23,42 @@ def generate_qr_code(data: str) -> str:
     )
     qr.add_data(data)
     qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Convert to base64
+    return qr
+
+
+def generate_qr_code(data: str, format: str = "png") -> str:
+    """Generate a QR code and return it as a base64 data URI
+
+    ``svg`` output is encoded by qrcode itself rather than through a Pillow
+    image (``import qrcode`` still loads Pillow).
+    """
+    qr = _build_qr(data)
     buffer = BytesIO()
-    img.save(buffer, format="PNG")
+
+    if format == "svg":
+        import qrcode.image.svg
+
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+        mime = "image/svg+xml"
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format="PNG")
+        mime = "image/png"
+
     img_str = base64.b64encode(buffer.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_str}"
+    return f"data:{mime};base64,{img_str}"
+
+
+async def render_qr_code(data: str, format: str = "png") -> str:
+    """``generate_qr_code`` on the render pool, keeping the event loop free"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.qr_render_workers, thread_name_prefix="qr")
+    return await asyncio.get_running_loop().run_in_executor(_executor, generate_qr_code, data, format)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,277 @@
+"""Token-bucket rate limiting for REST routes and WebSocket messages
+
+* ``TokenBucket`` - a single bucket, used per WebSocket connection.
+* ``RateLimiter`` - a table of buckets keyed by user/device/IP, stored as
+  ``key -> (tokens, updated)`` tuples and swept periodically so idle keys
+  don't accumulate.
+* ``RedisRateLimiter`` - the same algorithm as an atomic Lua script, so all
+  workers share buckets (optional ``redis`` package).
+* ``rate_limit()`` - FastAPI dependency factory; ``RateLimitMiddleware`` -
+  per-IP limit for every ``/api`` HTTP request.
+
+Client IPs come from ``X-Forwarded-For`` only when the direct peer is one of
+``settings.trusted_proxies``; otherwise every client behind a load balancer
+would share the proxy's address (and its buckets).
+"""
+from functools import lru_cache
+from ipaddress import ip_address, ip_network
+from math import ceil
+from typing import Iterable, Optional
+import asyncio
+import time
+
+from fastapi import Depends, HTTPException, Request
+
+
+class TokenBucket:
+    """Single token bucket (``rate`` tokens/sec, up to ``burst``)"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> bool:
+        now = time.monotonic()
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < cost:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - cost
+        return True
+
+
+class RateLimiter:
+    """In-memory table of token buckets"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self.allowed = 0
+        self.limited = 0
+
+    async def hit(self, key: str, cost: float = 1.0) -> Optional[float]:
+        """Take ``cost`` tokens; returns None if allowed, else seconds to wait"""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            self.limited += 1
+            return (cost - tokens) / self.rate
+        self._buckets[key] = (tokens - cost, now)
+        self.allowed += 1
+        return None
+
+    def sweep(self) -> int:
+        """Forget buckets that have refilled completely (same as a new key)"""
+        now = time.monotonic()
+        full_after = self.burst / self.rate
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+_REDIS_TOKEN_BUCKET = """
+local tokens_key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', tokens_key, 't', 'u')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = tokens >= cost
+if allowed then tokens = tokens - cost end
+redis.call('HSET', tokens_key, 't', tokens, 'u', now)
+redis.call('PEXPIRE', tokens_key, math.ceil(burst / rate * 1000) + 1000)
+if allowed then return '0' end
+return tostring((cost - tokens) / rate)
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Token buckets shared across workers through Redis"""
+
+    def __init__(self, rate: float, burst: float, url: str, prefix: str = "antigravity:rl:"):
+        super().__init__(rate, burst)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "rate_limit_backend='redis' requires the 'redis' package (pip install redis)"
+            ) from e
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET)
+
+    async def hit(self, key: str, cost: float = 1.0) -> Optional[float]:
+        result = float(await self._script(
+            keys=[self.prefix + key],
+            args=[self.rate, self.burst, time.time(), cost]
+        ))
+        if result > 0:
+            self.limited += 1
+            return result
+        self.allowed += 1
+        return None
+
+    def sweep(self) -> int:
+        return 0  # Redis expires idle buckets itself
+
+
+# Every limiter created through create_rate_limiter(), for sweeping and stats
+_limiters: dict[str, RateLimiter] = {}
+
+
+def create_rate_limiter(name: str, per_minute: float, backend: str = "memory",
+                        redis_url: Optional[str] = None) -> RateLimiter:
+    """Build (and register) a limiter allowing ``per_minute`` with an equal burst"""
+    rate = per_minute / 60.0
+    if backend == "redis":
+        if not redis_url:
+            raise RuntimeError("rate_limit_backend='redis' requires REDIS_URL")
+        limiter = RedisRateLimiter(rate, per_minute, redis_url, prefix=f"antigravity:rl:{name}:")
+    else:
+        limiter = RateLimiter(rate, per_minute)
+    _limiters[name] = limiter
+    return limiter
+
+
+async def sweep_rate_limiters(interval: float):
+    """Background task: drop idle buckets"""
+    while True:
+        await asyncio.sleep(interval)
+        for limiter in _limiters.values():
+            limiter.sweep()
+
+
+def rate_limit_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+class TrustedProxies:
+    """Peers whose ``X-Forwarded-For`` is believed (IPs, CIDRs or ``"*"``)"""
+
+    def __init__(self, entries: Iterable[str] = ()):
+        entries = list(entries)
+        self.trust_all = "*" in entries
+        self.networks = [ip_network(entry, strict=False) for entry in entries if entry != "*"]
+
+    def __contains__(self, host: str) -> bool:
+        if self.trust_all:
+            return True
+        try:
+            address = ip_address(host)
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+    def resolve(self, peer: Optional[str], forwarded_for: Optional[str]) -> str:
+        """The client address: the right-most ``X-Forwarded-For`` hop that
+        is not itself a trusted proxy, if the peer is trusted"""
+        if peer is None:
+            return "unknown"
+        if not forwarded_for or peer not in self:
+            return peer
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if hop not in self:
+                return hop
+        return hops[0] if hops else peer
+
+
+@lru_cache(maxsize=1)
+def _trusted_proxies() -> TrustedProxies:
+    from app.config import settings
+
+    return TrustedProxies(settings.trusted_proxies)
+
+
+def client_ip(request) -> str:
+    client = request.client
+    return _trusted_proxies().resolve(client.host if client else None, request.headers.get("x-forwarded-for"))
+
+
+def _user_or_ip(request: Request) -> str:
+    from app.utils.security import verify_token
+
+    authorization = request.headers.get("authorization")
+    if authorization and authorization.startswith("Bearer "):
+        payload = verify_token(authorization.split(" ")[1])
+        if payload:
+            return f"user:{payload['sub']}"
+    return f"ip:{client_ip(request)}"
+
+
+def _too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests",
+        headers={"Retry-After": str(max(1, ceil(retry_after)))}
+    )
+
+
+def rate_limit(name: str, per_minute: float, key: str = "ip"):
+    """FastAPI dependency limiting a route per client IP or per user (falls back to IP)"""
+    from app.config import settings
+
+    limiter = create_rate_limiter(
+        name, per_minute, settings.rate_limit_backend, settings.redis_url
+    )
+
+    async def dependency(request: Request):
+        if not settings.rate_limit_enabled:
+            return
+        identity = _user_or_ip(request) if key == "user" else f"ip:{client_ip(request)}"
+        retry_after = await limiter.hit(identity)
+        if retry_after is not None:
+            raise _too_many_requests(retry_after)
+
+    return Depends(dependency)
+
+
+class RateLimitMiddleware:
+    """Plain ASGI middleware: per-IP token bucket for every ``/api`` HTTP request"""
+
+    def __init__(self, app, limiter: RateLimiter, enabled: bool = True, path_prefix: str = "/api",
+                 trusted_proxies: Optional[TrustedProxies] = None):
+        self.app = app
+        self.limiter = limiter
+        self.enabled = enabled
+        self.path_prefix = path_prefix
+        self.trusted_proxies = trusted_proxies if trusted_proxies is not None else _trusted_proxies()
+
+    async def __call__(self, scope, receive, send):
+        if self.enabled and scope["type"] == "http" and scope["path"].startswith(self.path_prefix):
+            client = scope.get("client")
+            forwarded_for = None
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    forwarded_for = value.decode("latin-1")
+                    break
+            ip = self.trusted_proxies.resolve(client[0] if client else None, forwarded_for)
+            retry_after = await self.limiter.hit(f"ip:{ip}")
+            if retry_after is not None:
+                headers = [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(max(1, ceil(retry_after))).encode()),
+                ]
+                await send({"type": "http.response.start", "status": 429, "headers": headers})
+                await send({"type": "http.response.body", "body": b'{"detail":"Too many requests"}'})
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,181 @@
+"""Revoked-token (``jti``) stores with expiry
+
+Entries only need to live until the token's own ``exp``; after that the
+signature check rejects the token anyway. Lookups on the request path are
+always answered from process memory:
+
+* ``InMemoryRevocationStore`` - dict + expiry heap, optionally fronted by a
+  Bloom filter so the common "not revoked" answer needs no dict probe.
+* ``RedisRevocationStore`` - same local structures, plus a Redis sorted set
+  (score = exp) that every worker writes to and periodically syncs from.
+  Requires the optional ``redis`` package.
+"""
+from typing import Optional
+import asyncio
+import hashlib
+import heapq
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no deletes; rebuild instead)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class InMemoryRevocationStore:
+    """Process-local revocation set with expiry"""
+
+    def __init__(self, use_bloom: bool = False, bloom_capacity: int = 100_000):
+        self.use_bloom = use_bloom
+        self._bloom_capacity = bloom_capacity
+        self._bloom: Optional[BloomFilter] = BloomFilter(bloom_capacity) if use_bloom else None
+        self._revoked: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+
+        self.checks = 0
+        self.revoked_hits = 0
+
+    def is_revoked(self, jti: str) -> bool:
+        """O(1), never touches the network"""
+        self.checks += 1
+        if not self._revoked:
+            return False
+        if self._bloom is not None and jti not in self._bloom:
+            return False
+        exp = self._revoked.get(jti)
+        if exp is None or exp <= time.time():
+            return False
+        self.revoked_hits += 1
+        return True
+
+    def _add_local(self, jti: str, exp: float):
+        if exp <= time.time():
+            return
+        previous = self._revoked.get(jti)
+        if previous is not None and previous >= exp:
+            return
+        self._revoked[jti] = exp
+        heapq.heappush(self._heap, (exp, jti))
+        if self._bloom is not None:
+            if len(self._revoked) > self._bloom.capacity:
+                self._rebuild_bloom()
+            else:
+                self._bloom.add(jti)
+
+    async def revoke(self, jti: str, exp: float):
+        """Revoke ``jti`` until ``exp`` (POSIX seconds)"""
+        self._add_local(jti, exp)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop entries whose tokens have expired anyway"""
+        now = time.time() if now is None else now
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            exp, jti = heapq.heappop(self._heap)
+            if self._revoked.get(jti) == exp:
+                del self._revoked[jti]
+                removed += 1
+        if removed and self._bloom is not None:
+            self._rebuild_bloom()
+        return removed
+
+    def entries(self) -> dict[str, float]:
+        """Live ``{jti: exp}`` map (for snapshots)"""
+        return self._revoked
+
+    def load(self, entries: dict[str, float]):
+        """Re-add snapshotted revocations; already-expired ones are skipped"""
+        for jti, exp in entries.items():
+            self._add_local(jti, exp)
+
+    def _rebuild_bloom(self):
+        capacity = max(self._bloom_capacity, len(self._revoked) * 2)
+        self._bloom = BloomFilter(capacity)
+        for jti in self._revoked:
+            self._bloom.add(jti)
+
+    async def sync(self):
+        """Hook for shared backends; nothing to do locally"""
+
+    async def run(self, interval: float):
+        """Background task: sweep expired entries (and sync shared state)"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error("Revocation sync failed: %s", e)
+            self.sweep()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "revoked": len(self._revoked),
+            "checks": self.checks,
+            "revoked_hits": self.revoked_hits,
+            "bloom_filter": self._bloom is not None,
+        }
+
+
+class RedisRevocationStore(InMemoryRevocationStore):
+    """Revocations shared across workers through a Redis sorted set"""
+
+    def __init__(self, url: str, key: str = "antigravity:revoked_jti", **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "revocation_backend='redis' requires the 'redis' package (pip install redis)"
+            ) from e
+        self.key = key
+        self._client = redis.from_url(url)
+
+    async def revoke(self, jti: str, exp: float):
+        self._add_local(jti, exp)
+        await self._client.zadd(self.key, {jti: exp})
+
+    async def sync(self):
+        """Pull revocations made by other workers and trim expired ones"""
+        now = time.time()
+        await self._client.zremrangebyscore(self.key, "-inf", now)
+        for member, score in await self._client.zrangebyscore(self.key, now, "+inf", withscores=True):
+            jti = member.decode() if isinstance(member, bytes) else member
+            if jti not in self._revoked:
+                self._add_local(jti, score)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "backend": "redis"}
+
+
+def create_revocation_store(backend: str, redis_url: Optional[str] = None, use_bloom: bool = False):
+    """Build the configured revocation store"""
+    if backend == "redis":
+        if not redis_url:
+            raise RuntimeError("revocation_backend='redis' requires REDIS_URL")
+        return RedisRevocationStore(redis_url, use_bloom=use_bloom)
+    return InMemoryRevocationStore(use_bloom=use_bloom)
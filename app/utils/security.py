@@ -1,30 +1,78 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
 import hashlib
+import hmac
 import secrets
 from app.config import settings
+from app.utils.token_cache import TokenCache
+from app.utils.revocation import create_revocation_store
+
+# Verified claims, so repeat presentations of a token skip jwt.decode
+token_cache = TokenCache(
+    max_size=settings.token_cache_max_size,
+    ttl=settings.token_cache_ttl_seconds
+)
+
+# Revoked jti claims (logout, refresh rotation), kept until the token's exp
+revocation_store = create_revocation_store(
+    settings.revocation_backend,
+    redis_url=settings.redis_url,
+    use_bloom=settings.revocation_bloom_filter
+)
+
+
+def _scrypt(password: str, salt: str, n: int, r: int, p: int) -> str:
+    return hashlib.scrypt(
+        password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+        maxmem=max(64 * 1024 * 1024, 256 * n * r * p), dklen=32
+    ).hex()
+
+
+def _pbkdf2(password: str, salt: str, iterations: int) -> str:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), iterations).hex()
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash (SHA256-based)"""
-    # Extract salt from stored hash (format: salt$hash)
-    if '$' not in hashed_password:
+    """Verify a password against its hash (CPU-heavy: call via the hashing pool)
+
+    Formats: ``scrypt$n$r$p$salt$hash``, ``pbkdf2_sha256$iterations$salt$hash``
+    and the legacy single SHA256 ``salt$hash``.
+    """
+    parts = hashed_password.split('$')
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            password_hash = _scrypt(plain_password, parts[4], n, r, p)
+        elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            password_hash = _pbkdf2(plain_password, parts[2], int(parts[1]))
+        elif len(parts) == 2:
+            password_hash = hashlib.sha256((parts[0] + plain_password).encode()).hexdigest()
+        else:
+            return False
+    except ValueError:
         return False
-    salt, stored_hash = hashed_password.split('$', 1)
-    # Hash the provided password with the stored salt
-    password_hash = hashlib.sha256((salt + plain_password).encode()).hexdigest()
-    return password_hash == stored_hash
+    return hmac.compare_digest(password_hash, parts[-1])
 
 
 def get_password_hash(password: str) -> str:
-    """Hash a password using SHA256 with salt (simple, no bcrypt issues)"""
-    # Generate a random salt
+    """Hash a password with the configured KDF (CPU-heavy: call via the hashing pool)"""
     salt = secrets.token_hex(16)
-    # Hash password with salt
-    password_hash = hashlib.sha256((salt + password).encode()).hexdigest()
-    # Return format: salt$hash
-    return f"{salt}${password_hash}"
+    if settings.password_kdf == "pbkdf2_sha256":
+        iterations = settings.pbkdf2_iterations
+        return f"pbkdf2_sha256${iterations}${salt}${_pbkdf2(password, salt, iterations)}"
+    
+    n, r, p = settings.scrypt_n, settings.scrypt_r, settings.scrypt_p
+    return f"scrypt${n}${r}${p}${salt}${_scrypt(password, salt, n, r, p)}"
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash uses an outdated KDF or cost"""
+    parts = hashed_password.split('$')
+    if settings.password_kdf == "pbkdf2_sha256":
+        return parts[0] != "pbkdf2_sha256" or parts[1] != str(settings.pbkdf2_iterations)
+    return parts[0] != "scrypt" or parts[1:4] != [
+        str(settings.scrypt_n), str(settings.scrypt_r), str(settings.scrypt_p)
+    ]
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -35,7 +83,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.access_token_expire_minutes)
     
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "type": "access", "jti": secrets.token_urlsafe(12)})
+    from jose import jwt  # imported on first use to keep startup fast
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
@@ -44,20 +93,41 @@ def create_refresh_token(data: dict) -> str:
     """Create a JWT refresh token"""
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.refresh_token_expire_days)
-    to_encode.update({"exp": expire, "type": "refresh"})
+    to_encode.update({"exp": expire, "type": "refresh", "jti": secrets.token_urlsafe(12)})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
 
 def verify_token(token: str, token_type: str = "access") -> Optional[dict]:
-    """Verify and decode a JWT token"""
-    try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
-        if payload.get("type") != token_type:
+    """Verify and decode a JWT token (cached; treat the result as read-only)"""
+    payload = token_cache.get(token)
+    if payload is None:
+        from jose import JWTError, jwt
+        try:
+            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
+        except JWTError:
             return None
-        return payload
-    except JWTError:
+        token_cache.put(token, payload)
+    
+    if payload.get("type") != token_type:
+        return None
+    
+    jti = payload.get("jti")
+    if jti and revocation_store.is_revoked(jti):
         return None
+    return payload
+
+
+async def revoke_token(token: str, token_type: str = "access") -> bool:
+    """Revoke a valid token until its expiry; returns False if it wasn't valid"""
+    payload = verify_token(token, token_type)
+    if not payload or not payload.get("jti"):
+        return False
+    
+    await revocation_store.revoke(payload["jti"], payload["exp"])
+    token_cache.invalidate(token)
+    return True
 
 
 def generate_pairing_code() -> str:
@@ -0,0 +1,215 @@
+"""Periodic snapshots of the in-memory stores
+
+Stores register a ``dump`` callable (returns the live state) and a ``load``
+callable (replaces the live state and rebuilds derived indexes). A snapshot
+is one pickle file, written to a temp file and renamed into place, so a
+crash mid-write leaves the previous snapshot intact.
+
+Where ``os.fork`` is available the child process pickles a copy-on-write
+view of the heap while the event loop carries on; the parent only waits for
+the child's exit status in a worker thread. Elsewhere (or with
+``use_fork=False``) the top two levels of each store are copied on the loop
+and pickled in a worker thread.
+
+The process is multithreaded (log writer, hashing/QR pools, audit writes),
+so a forked child can in principle deadlock on a lock another thread held
+at fork time. The child therefore gets ``fork_timeout`` seconds; after that
+it is killed and the snapshot is taken in-process instead.
+"""
+from typing import Any, Callable, Optional
+import asyncio
+import logging
+import os
+import pickle
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def _shallow_copy(value: Any) -> Any:
+    """Copy containers two levels deep: enough that inserts/deletes made by
+    the event loop can't race the pickler in another thread"""
+    if isinstance(value, dict):
+        return {key: _copy_one(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_copy_one(item) for item in value]
+    return value
+
+
+def _copy_one(value: Any) -> Any:
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class SnapshotManager:
+    """Saves registered stores to ``path`` and restores them on startup"""
+
+    def __init__(self, path: str, use_fork: bool = True, fork_timeout: float = 120.0):
+        self.path = path
+        self.use_fork = use_fork and hasattr(os, "fork")
+        self.fork_timeout = fork_timeout
+        self._stores: dict[str, tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+        self._lock = asyncio.Lock()
+
+        self.saves = 0
+        self.failures = 0
+        self.fork_fallbacks = 0
+        self.last_save_seconds = 0.0
+        self.last_save_at: Optional[float] = None
+        self.last_restore_seconds = 0.0
+        self.restored_at: Optional[float] = None
+
+    def register(self, name: str, dump: Callable[[], Any], load: Callable[[Any], None]):
+        self._stores[name] = (dump, load)
+
+    # ------------------------------------------------------------------
+    # Saving
+    # ------------------------------------------------------------------
+
+    def _write(self, stores: dict):
+        """Pickle ``stores`` to a temp file, fsync, then rename into place"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        payload = {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "created_at": time.time(),
+            "stores": stores,
+        }
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _fork_writer(self) -> int:
+        """Fork a child that writes the snapshot; returns its pid
+
+        Called on the event loop thread, so the child sees the stores as of
+        a point between two callbacks, never half-way through one.
+        """
+        pid = os.fork()
+        if pid == 0:
+            # Child: the heap is a frozen copy-on-write view; never return
+            # into the parent's event loop
+            status = 0
+            try:
+                self._write({name: dump() for name, (dump, _) in self._stores.items()})
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+        return pid
+
+    @staticmethod
+    def _wait_child(pid: int) -> int:
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status)
+
+    async def _save_forked(self) -> bool:
+        """Snapshot from a forked child; False if it failed or hung"""
+        pid = self._fork_writer()
+        waiter = asyncio.ensure_future(asyncio.to_thread(self._wait_child, pid))
+        try:
+            status = await asyncio.wait_for(asyncio.shield(waiter), self.fork_timeout)
+        except asyncio.TimeoutError:
+            os.kill(pid, signal.SIGKILL)
+            await waiter  # reap it
+            try:
+                os.remove(f"{self.path}.{pid}.tmp")
+            except OSError:
+                pass
+            logger.error("Snapshot child %d killed after %.0fs", pid, self.fork_timeout)
+            return False
+        if status != 0:
+            logger.error("Snapshot child exited with status %s", status)
+            return False
+        return True
+
+    async def _save_in_process(self):
+        stores = {name: _shallow_copy(dump()) for name, (dump, _) in self._stores.items()}
+        await asyncio.to_thread(self._write, stores)
+
+    async def save(self, use_fork: Optional[bool] = None) -> bool:
+        """Write a snapshot without blocking the event loop for the pickling"""
+        use_fork = self.use_fork if use_fork is None else use_fork
+        async with self._lock:
+            start = time.perf_counter()
+            try:
+                if not (use_fork and await self._save_forked()):
+                    if use_fork:
+                        self.fork_fallbacks += 1
+                    await self._save_in_process()
+            except Exception as e:
+                self.failures += 1
+                logger.error("Snapshot to %s failed: %s", self.path, e)
+                return False
+
+            self.saves += 1
+            self.last_save_seconds = time.perf_counter() - start
+            self.last_save_at = time.time()
+            logger.debug("Snapshot written in %.3fs", self.last_save_seconds)
+            return True
+
+    async def run(self, interval: float):
+        """Background task: snapshot every ``interval`` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+    # ------------------------------------------------------------------
+    # Restoring
+    # ------------------------------------------------------------------
+
+    def restore(self) -> bool:
+        """Load the last snapshot, if any, into the registered stores"""
+        if not os.path.exists(self.path):
+            return False
+
+        start = time.perf_counter()
+        try:
+            with open(self.path, "rb") as f:
+                payload = pickle.load(f)
+        except Exception as e:
+            logger.error("Could not read snapshot %s: %s", self.path, e)
+            return False
+
+        if payload.get("version") != SNAPSHOT_FORMAT_VERSION:
+            logger.warning("Ignoring snapshot with unknown format version %s", payload.get("version"))
+            return False
+
+        stores = payload["stores"]
+        for name, (_, load) in self._stores.items():
+            if name in stores:
+                load(stores[name])
+
+        self.last_restore_seconds = time.perf_counter() - start
+        self.restored_at = payload.get("created_at")
+        logger.info("Restored snapshot (%s) in %.3fs", ", ".join(stores), self.last_restore_seconds)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "fork": self.use_fork,
+            "saves": self.saves,
+            "failures": self.failures,
+            "fork_fallbacks": self.fork_fallbacks,
+            "last_save_seconds": round(self.last_save_seconds, 4),
+            "last_save_at": self.last_save_at,
+            "last_restore_seconds": round(self.last_restore_seconds, 4),
+            "restored_snapshot_created_at": self.restored_at,
+        }
@@ -0,0 +1,107 @@
+"""Cold import time of ``app.main``
+
+    python benchmarks/bench_import_time.py [--runs 10] [--max-ms 1500]
+                                           [--baseline old.json] [--output new.json]
+
+Imports the app in fresh interpreters (so nothing is cached in
+``sys.modules``) and reports the median wall time, alongside the time to
+import FastAPI alone. Also checks that importing the app does not pull in
+modules that are only needed on specific routes and does not touch the
+filesystem. Exits 1 if a check fails or the median exceeds the budget.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed when a QR code is rendered / a token is issued or checked
+LAZY_MODULES = ("qrcode", "PIL", "jose")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [name for name in {lazy!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe(module: str, env: dict) -> dict:
+    code = PROBE.format(module=module, lazy=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    # The app logs to stdout; the probe's line is the last one
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(module: str, runs: int, env: dict) -> tuple[float, list]:
+    samples = [probe(module, env) for _ in range(runs)]
+    return statistics.median(s["seconds"] for s in samples), samples[-1]["loaded"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import exceeds this")
+    parser.add_argument("--baseline", help="JSON from a previous --output; fail if >20%% slower")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = os.path.join(tmp, "files")
+        env = dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            AUDIT_LOG_PATH=os.path.join(tmp, "audit"),
+            FILE_STORAGE_PATH=storage,
+            SNAPSHOT_ENABLED="false",
+        )
+
+        framework, _ = measure("fastapi", args.runs, env)
+        app_seconds, loaded = measure("app.main", args.runs, env)
+        storage_created = os.path.exists(storage)
+
+    results = {
+        "runs": args.runs,
+        "fastapi_ms": round(framework * 1000, 1),
+        "app_main_ms": round(app_seconds * 1000, 1),
+        "app_overhead_ms": round((app_seconds - framework) * 1000, 1),
+        "lazy_modules_loaded": loaded,
+        "storage_created_at_import": storage_created,
+    }
+    for key, value in results.items():
+        print(f"{key:>26}: {value}")
+
+    failures = []
+    if loaded:
+        failures.append(f"imported at startup: {', '.join(loaded)}")
+    if storage_created:
+        failures.append("storage directory created at import time")
+    if args.max_ms is not None and results["app_main_ms"] > args.max_ms:
+        failures.append(f"import took {results['app_main_ms']}ms (budget {args.max_ms}ms)")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if results["app_main_ms"] > baseline["app_main_ms"] * 1.2:
+            failures.append(f"import took {results['app_main_ms']}ms (baseline {baseline['app_main_ms']}ms)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
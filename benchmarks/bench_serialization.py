@@ -0,0 +1,109 @@
+"""List-endpoint serialization: Pydantic rows vs the fast JSON path
+
+    python benchmarks/bench_serialization.py [--rows 1000 10000] [--repeat 20]
+
+Serves the same page of commands from three routes of a throwaway app:
+
+* ``model``  - ``CommandResponse(**cmd)`` per row, FastAPI validates and
+  encodes through ``response_model`` (the previous ``list_commands``)
+* ``fast``   - plain dicts encoded by ``app.utils.fast_json``
+* ``stream`` - the same, streamed in batches
+
+and reports the median request time for each (``orjson`` is used by the
+fast paths when it is installed).
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.routers.commands import _command_row  # noqa: E402
+from app.schemas.command import CommandListResponse, CommandResponse  # noqa: E402
+from app.utils import fast_json  # noqa: E402
+
+
+def build_commands(count: int) -> list[dict]:
+    start = datetime(2026, 1, 1)
+    return [
+        {
+            "command_id": f"cmd_{i:08x}",
+            "target_device_id": f"dev_desktop_{i % 10:08x}",
+            "type": "run_command",
+            "payload": {"command": "git status", "cwd": "/home/user/project"},
+            "status": "completed",
+            "created_at": start + timedelta(milliseconds=i),
+            "started_at": start + timedelta(milliseconds=i + 5),
+            "completed_at": start + timedelta(milliseconds=i + 50),
+            "result": {"exit_code": 0, "output": "On branch main\nnothing to commit, working tree clean"},
+        }
+        for i in range(count)
+    ]
+
+
+def build_app(page: list[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/model", response_model=CommandListResponse)
+    async def model_route():
+        return CommandListResponse(
+            commands=[CommandResponse(**cmd) for cmd in page],
+            total=len(page), limit=len(page), offset=0
+        )
+
+    @app.get("/fast", response_model=CommandListResponse)
+    async def fast_route():
+        document = {"commands": [_command_row(cmd) for cmd in page],
+                    "total": len(page), "limit": len(page), "offset": 0}
+        return fast_json.json_response(document)
+
+    @app.get("/stream", response_model=CommandListResponse)
+    async def stream_route():
+        document = {"commands": [_command_row(cmd) for cmd in page],
+                    "total": len(page), "limit": len(page), "offset": 0}
+        return fast_json.json_response(document, rows=len(page), stream_min_rows=0)
+
+    return app
+
+
+def time_route(client: TestClient, path: str, repeat: int) -> tuple[float, bytes]:
+    body = client.get(path).content  # warm up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return statistics.median(samples), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"encoder: {'orjson' if fast_json.orjson is not None else 'json (stdlib)'}")
+    for rows in args.rows:
+        client = TestClient(build_app(build_commands(rows)))
+        results = {path: time_route(client, f"/{path}", args.repeat) for path in ("model", "fast", "stream")}
+
+        expected = json.loads(results["model"][1])
+        for path in ("fast", "stream"):
+            assert json.loads(results[path][1]) == expected, f"{path} body differs from model body"
+
+        baseline = results["model"][0]
+        for path, (elapsed, body) in results.items():
+            print(f"{rows:>6} rows  {path:<6} {elapsed * 1000:8.2f} ms  "
+                  f"{len(body) / 1024:8.1f} KiB  x{baseline / elapsed:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Snapshot save/restore timings for a large commands store
+
+    python benchmarks/bench_snapshot_restore.py [--commands 1000000]
+
+Fills a commands store shaped like ``create_command`` output, writes it
+with both snapshot strategies (forked child and copy + thread), then
+restores it into empty stores and rebuilds ``command_order``.
+"""
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.snapshot import SnapshotManager  # noqa: E402
+
+
+def build_commands(count: int) -> dict:
+    start = datetime(2026, 1, 1)
+    commands = {}
+    for i in range(count):
+        command_id = f"cmd_{i:08x}"
+        commands[command_id] = {
+            "command_id": command_id,
+            "target_device_id": f"dev_desktop_{i % 1000:08x}",
+            "type": "run_command",
+            "payload": {"command": "git status", "cwd": "/home/user/project"},
+            "status": "completed",
+            "created_at": start + timedelta(milliseconds=i),
+            "started_at": start + timedelta(milliseconds=i + 5),
+            "completed_at": start + timedelta(milliseconds=i + 50),
+            "result": {"exit_code": 0, "output": "nothing to commit"},
+        }
+    return commands
+
+
+async def time_save(manager: SnapshotManager, use_fork: bool) -> float:
+    start = time.perf_counter()
+    if not await manager.save(use_fork=use_fork):
+        raise RuntimeError("snapshot failed")
+    return time.perf_counter() - start
+
+
+async def time_loop_stall(manager: SnapshotManager, use_fork: bool) -> float:
+    """Longest gap between ticks of a 1 ms timer while a snapshot runs"""
+    worst = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    await manager.save(use_fork=use_fork)
+    done.set()
+    await task
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    commands = build_commands(args.commands)
+    command_order = list(commands)
+    print(f"built {len(commands):,} commands in {time.perf_counter() - start:.2f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.pickle")
+        manager = SnapshotManager(path)
+        manager.register("commands", lambda: commands, lambda state: None)
+
+        strategies = [False] + ([True] if hasattr(os, "fork") else [])
+        for use_fork in strategies:
+            name = "fork" if use_fork else "copy+thread"
+            elapsed = asyncio.run(time_save(manager, use_fork))
+            stall = asyncio.run(time_loop_stall(manager, use_fork))
+            print(f"save ({name}): {elapsed:.2f}s, worst event-loop stall {stall * 1000:.1f}ms")
+        print(f"snapshot size: {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+
+        restored_db: dict = {}
+        restored_order: list = []
+
+        def load(state: dict):
+            restored_db.clear()
+            restored_db.update(state)
+            restored_order[:] = list(restored_db)
+
+        restorer = SnapshotManager(path)
+        restorer.register("commands", lambda: restored_db, load)
+        start = time.perf_counter()
+        if not restorer.restore():
+            raise RuntimeError("restore failed")
+        elapsed = time.perf_counter() - start
+
+        assert len(restored_db) == len(commands)
+        assert restored_order == command_order
+        print(f"restore: {elapsed:.2f}s ({len(restored_db) / elapsed:,.0f} commands/s)")
+
+
+if __name__ == "__main__":
+    main()
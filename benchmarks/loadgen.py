@@ -0,0 +1,508 @@
+"""Load generator: fake desktop agents and mobiles against a local server
+
+    python benchmarks/loadgen.py --desktops 20 --mobiles 10 --duration 15 \\
+        --output results.json
+    python benchmarks/loadgen.py ... --compare baseline.json --threshold 0.15
+
+Starts the app under uvicorn (a subprocess by default, or ``--server
+inprocess`` on a thread of this process) with rate limiting and snapshots
+disabled. Then:
+
+* N desktops connect to ``/api/v1/ws``. They answer ``get_projects``,
+  ``get_tree`` and ``read_file``, and stream ``command_chunk`` messages
+  followed by ``command_complete`` for every dispatched command.
+* M mobiles connect and count relayed chunks/responses.
+* HTTP workers drive ``POST /api/v1/commands`` and the ``/api/v1/projects``
+  routes (list, tree, file) over keep-alive connections.
+
+Reports throughput, p50/p99 latencies and server RSS as JSON. ``--compare``
+diffs against an earlier result file and exits non-zero when throughput
+drops or p99 latency grows by more than ``--threshold``.
+"""
+from typing import Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROJECT_OPS = ("list_projects", "project_tree", "read_file")
+
+
+# ----------------------------------------------------------------------
+# Measurement helpers
+# ----------------------------------------------------------------------
+
+class Stats:
+    """Latency samples and error count for one operation"""
+
+    def __init__(self):
+        self.samples: list[float] = []
+        self.errors = 0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def summary(self, duration: float) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(q: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+
+        return {
+            "count": len(samples),
+            "errors": self.errors,
+            "per_second": round(len(samples) / duration, 2),
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(samples[-1] * 1000, 3) if samples else None,
+        }
+
+
+def rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Resident set size of ``pid`` (default: this process) in MiB"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid is None:
+        # Peak rather than current, but better than nothing off Linux
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return None
+
+
+# ----------------------------------------------------------------------
+# Minimal keep-alive HTTP/1.1 client
+# ----------------------------------------------------------------------
+
+class HTTPConnection:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None) -> tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+        if body is not None:
+            head += "Content-Type: application/json\r\n"
+        head += f"Content-Length: {len(payload)}\r\n\r\n"
+        self.writer.write(head.encode() + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            await self.close()
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b"".join(chunks)
+        else:
+            data = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, data
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+
+# ----------------------------------------------------------------------
+# Simulated clients
+# ----------------------------------------------------------------------
+
+class LoadGenerator:
+    def __init__(self, args, host: str, port: int):
+        self.args = args
+        self.host = host
+        self.port = port
+        self.ws_url = f"ws://{host}:{port}/api/v1/ws"
+        self.desktop_ids = [f"dev_desktop_lg{i:04d}" for i in range(args.desktops)]
+
+        self.http = {op: Stats() for op in ("create_command", "list_projects", "project_tree", "read_file")}
+        self.command_e2e = Stats()  # POST sent -> command_response at a mobile
+        # command_id -> POST start time, or None once its sample is recorded.
+        # The desktop can answer before the POST's own response arrives, so
+        # early command_responses wait in command_early until it does.
+        self.command_sent: dict[str, Optional[float]] = {}
+        self.command_early: dict[str, float] = {}
+        self.chunks_sent = 0
+        self.chunks_received = 0
+        self.responses_received = 0
+        self.ws_errors = 0
+        self.stop = asyncio.Event()
+
+    async def _connect(self, device_id: str, device_type: str):
+        ws = await websockets.connect(self.ws_url, max_size=None, ping_interval=None)
+        await ws.send(json.dumps({
+            "device_id": device_id,
+            "device_type": device_type,
+            "device_name": f"loadgen {device_id}",
+        }))
+        ack = json.loads(await ws.recv())
+        if ack.get("type") != "connection_ack":
+            raise RuntimeError(f"unexpected handshake reply: {ack}")
+        return ws
+
+    async def desktop(self, device_id: str, ready: asyncio.Event):
+        chunk = "x" * self.args.chunk_size
+        ws = await self._connect(device_id, "desktop")
+        ready.set()
+        try:
+            async for raw in ws:
+                if isinstance(raw, bytes):
+                    continue
+                message = json.loads(raw)
+                kind = message.get("type")
+                request_id = message.get("request_id")
+                if kind == "command_dispatch":
+                    command_id = message["command_id"]
+                    for _ in range(self.args.chunks_per_command):
+                        await ws.send(json.dumps({"type": "command_chunk", "command_id": command_id, "chunk": chunk}))
+                        self.chunks_sent += 1
+                    await ws.send(json.dumps({"type": "command_complete", "command_id": command_id, "response": "done"}))
+                elif kind == "get_projects":
+                    await ws.send(json.dumps({
+                        "type": "projects_list",
+                        "request_id": request_id,
+                        "projects": [{"id": f"p{i}", "name": f"project {i}"} for i in range(10)],
+                    }))
+                elif kind == "get_tree":
+                    await ws.send(json.dumps({
+                        "type": "project_tree",
+                        "request_id": request_id,
+                        "tree": [{"name": f"file{i}.py", "type": "file"} for i in range(50)],
+                    }))
+                elif kind == "read_file":
+                    await ws.send(json.dumps({"type": "file_content", "request_id": request_id, "content": chunk * 4}))
+        except websockets.ConnectionClosed:
+            if not self.stop.is_set():
+                self.ws_errors += 1
+        finally:
+            await ws.close()
+
+    async def mobile(self, device_id: str, ready: asyncio.Event):
+        ws = await self._connect(device_id, "mobile")
+        ready.set()
+        try:
+            async for raw in ws:
+                message = json.loads(raw)
+                kind = message.get("type")
+                if kind == "command_chunk":
+                    self.chunks_received += 1
+                elif kind == "command_response":
+                    self.responses_received += 1
+                    command_id = message.get("command_id")
+                    if command_id not in self.command_sent:
+                        self.command_early.setdefault(command_id, time.perf_counter())
+                    elif self.command_sent[command_id] is not None:
+                        self.command_e2e.add(time.perf_counter() - self.command_sent[command_id])
+                        self.command_sent[command_id] = None
+        except websockets.ConnectionClosed:
+            if not self.stop.is_set():
+                self.ws_errors += 1
+        finally:
+            await ws.close()
+
+    async def http_worker(self):
+        conn = HTTPConnection(self.host, self.port)
+        rng = random.Random()
+        try:
+            while not self.stop.is_set():
+                device_id = rng.choice(self.desktop_ids)
+                if rng.random() < self.args.project_ratio:
+                    op, method, body = rng.choice(PROJECT_OPS), "GET", None
+                    if op == "list_projects":
+                        path = f"/api/v1/projects?device_id={device_id}"
+                    elif op == "project_tree":
+                        path = f"/api/v1/projects/p1/tree?device_id={device_id}&path=src"
+                    else:
+                        path = f"/api/v1/projects/p1/file?device_id={device_id}&path=src/main.py"
+                else:
+                    op, method, path = "create_command", "POST", "/api/v1/commands"
+                    body = {"target_device_id": device_id, "type": "run_command", "payload": {"command": "ls"}}
+
+                start = time.perf_counter()
+                try:
+                    status, data = await conn.request(method, path, body)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    self.http[op].errors += 1
+                    await conn.close()
+                    continue
+                if status >= 400:
+                    self.http[op].errors += 1
+                    continue
+                self.http[op].add(time.perf_counter() - start)
+                if op == "create_command":
+                    command_id = json.loads(data)["command_id"]
+                    received = self.command_early.pop(command_id, None)
+                    if received is not None:
+                        self.command_e2e.add(received - start)
+                    self.command_sent[command_id] = start if received is None else None
+        finally:
+            await conn.close()
+
+    async def run(self, rss_sampler) -> dict:
+        ready_events = []
+        clients = []
+        for device_id in self.desktop_ids:
+            ready = asyncio.Event()
+            ready_events.append(ready)
+            clients.append(asyncio.create_task(self.desktop(device_id, ready)))
+        for i in range(self.args.mobiles):
+            ready = asyncio.Event()
+            ready_events.append(ready)
+            clients.append(asyncio.create_task(self.mobile(f"dev_mobile_lg{i:04d}", ready)))
+        await asyncio.wait_for(asyncio.gather(*(event.wait() for event in ready_events)), timeout=30)
+
+        rss_idle = rss_sampler()
+        rss_peak = rss_idle or 0.0
+        workers = [asyncio.create_task(self.http_worker()) for _ in range(self.args.concurrency)]
+
+        start = time.perf_counter()
+        deadline = start + self.args.duration
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(0.5)
+            rss_peak = max(rss_peak, rss_sampler() or 0.0)
+        self.stop.set()
+        await asyncio.gather(*workers, return_exceptions=True)
+        duration = time.perf_counter() - start
+
+        # Let in-flight relays drain before closing the sockets
+        await asyncio.sleep(0.5)
+        rss_end = rss_sampler()
+        for task in clients:
+            task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+        return {
+            "duration_seconds": round(duration, 3),
+            "http": {op: stats.summary(duration) for op, stats in self.http.items()},
+            "command_end_to_end": self.command_e2e.summary(duration),
+            "relay": {
+                "chunks_sent": self.chunks_sent,
+                "chunks_received": self.chunks_received,
+                "chunks_received_per_second": round(self.chunks_received / duration, 2),
+                "responses_received": self.responses_received,
+            },
+            "ws_errors": self.ws_errors,
+            "rss_mb": {"idle": rss_idle, "peak": rss_peak, "end": rss_end},
+        }
+
+
+# ----------------------------------------------------------------------
+# Server management
+# ----------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server_env(workdir: str) -> dict:
+    return {
+        "RATE_LIMIT_ENABLED": "false",
+        "SNAPSHOT_ENABLED": "false",
+        "AUDIT_LOG_PATH": os.path.join(workdir, "audit"),
+        "FILE_STORAGE_PATH": os.path.join(workdir, "files"),
+    }
+
+
+async def _wait_ready(host: str, port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = HTTPConnection(host, port)
+        try:
+            status, _ = await conn.request("GET", "/health")
+            if status == 200:
+                return
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await conn.close()
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not become ready")
+
+
+def start_subprocess_server(port: int, workdir: str, verbose: bool = False) -> subprocess.Popen:
+    env = {**os.environ, **_server_env(workdir)}
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=output, stderr=output
+    )
+
+
+def start_inprocess_server(port: int, workdir: str):
+    os.environ.update(_server_env(workdir))
+    sys.path.insert(0, ROOT)
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    return server, thread
+
+
+# ----------------------------------------------------------------------
+# Comparison
+# ----------------------------------------------------------------------
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Regressions beyond ``threshold`` (fractional) versus ``baseline``"""
+    regressions = []
+
+    def check(label: str, new, old, higher_is_better: bool):
+        if new is None or old in (None, 0):
+            return
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        marker = "REGRESSION" if worse > threshold else "ok"
+        print(f"  {label:<44} {old:>12} -> {new:>12} ({change:+.1%}) {marker}")
+        if worse > threshold:
+            regressions.append(label)
+
+    cur, base = current["results"], baseline["results"]
+    for op in cur["http"]:
+        if op in base["http"]:
+            check(f"http.{op}.per_second", cur["http"][op]["per_second"], base["http"][op]["per_second"], True)
+            check(f"http.{op}.p99_ms", cur["http"][op]["p99_ms"], base["http"][op]["p99_ms"], False)
+    check("command_end_to_end.p99_ms", cur["command_end_to_end"]["p99_ms"], base["command_end_to_end"]["p99_ms"], False)
+    check("relay.chunks_received_per_second", cur["relay"]["chunks_received_per_second"],
+          base["relay"]["chunks_received_per_second"], True)
+    check("rss_mb.peak", cur["rss_mb"]["peak"], base["rss_mb"]["peak"], False)
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args) -> dict:
+    port = args.port or _free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        process = server = None
+        if args.server == "subprocess":
+            process = start_subprocess_server(port, workdir, args.verbose)
+            rss_sampler = lambda: rss_mb(process.pid)  # noqa: E731
+        else:
+            server, _ = start_inprocess_server(port, workdir)
+            rss_sampler = rss_mb
+        try:
+            await _wait_ready("127.0.0.1", port)
+            results = await LoadGenerator(args, "127.0.0.1", port).run(rss_sampler)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=15)
+            if server is not None:
+                server.should_exit = True
+
+    return {
+        "benchmark": "loadgen",
+        "git_commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "config": {
+            "server": args.server,
+            "desktops": args.desktops,
+            "mobiles": args.mobiles,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "chunks_per_command": args.chunks_per_command,
+            "chunk_size": args.chunk_size,
+            "project_ratio": args.project_ratio,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay load generator")
+    parser.add_argument("--desktops", type=int, default=10)
+    parser.add_argument("--mobiles", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent HTTP workers")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--chunks-per-command", type=int, default=20)
+    parser.add_argument("--chunk-size", type=int, default=256, help="characters per chunk")
+    parser.add_argument("--project-ratio", type=float, default=0.3,
+                        help="fraction of HTTP requests that hit /projects instead of creating commands")
+    parser.add_argument("--server", choices=["subprocess", "inprocess"], default="subprocess")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show the server subprocess's output")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, e.g. 0.10 = 10%%")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare} ({baseline.get('git_commit')}):")
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
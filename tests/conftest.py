@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Keep the app's runtime data out of the repo (read when app.config is imported)
+_data_dir = tempfile.mkdtemp(prefix="antigravity-tests-")
+os.environ.setdefault("AUDIT_LOG_PATH", os.path.join(_data_dir, "audit"))
+os.environ.setdefault("FILE_STORAGE_PATH", os.path.join(_data_dir, "files"))
+os.environ.setdefault("SNAPSHOT_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
@@ -0,0 +1,26 @@
+from app.utils.audit_log import AuditLog
+
+
+def _fill(directory, count: int, **kwargs) -> AuditLog:
+    log = AuditLog(str(directory), segment_max_entries=10, retention_days=0, **kwargs)
+    log.extend(("login", "dev_1", "user_1", None, 1_000.0 + i) for i in range(count))
+    return log
+
+
+def test_segments_before_a_gap_are_deleted_on_load(tmp_path):
+    _fill(tmp_path, 30).close()  # segments starting at seq 0, 10 and 20
+    (tmp_path / "audit-000000000010.log").unlink()
+
+    log = AuditLog(str(tmp_path), segment_max_entries=10, retention_days=0)
+    assert log.stats()["oldest_seq"] == 20
+    assert len(log) == 10
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["audit-000000000020.log"]
+
+
+def test_max_entries_caps_the_index(tmp_path):
+    log = _fill(tmp_path, 100, max_segments=0, max_entries=25)
+
+    stats = log.stats()
+    assert stats["entries"] <= 25
+    assert stats["segments"] == len(list(tmp_path.iterdir()))
+    assert log.query(limit=1)["logs"][0]["log_id"] == f"log_{stats['oldest_seq'] + 1:03d}"
@@ -0,0 +1,26 @@
+import hashlib
+import os
+
+from app.utils.blob_store import BlobStore
+
+
+def _commit(store: BlobStore, tmp_path, content: bytes) -> dict:
+    sha256 = hashlib.sha256(content).hexdigest()
+    staging = tmp_path / f"staging-{sha256}"
+    staging.write_bytes(content)
+    blob_path, _ = store.commit(str(staging), sha256, len(content))
+    return {"sha256": sha256, "file_path": blob_path, "size_bytes": len(content)}
+
+
+def test_sweep_removes_blobs_without_metadata_after_rebuild(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+    kept = _commit(store, tmp_path, b"in the snapshot")
+    lost = _commit(store, tmp_path, b"uploaded after the snapshot")
+
+    restarted = BlobStore(store.root)
+    restarted.rebuild([kept])
+    assert restarted.sweep() == 1
+
+    assert os.path.exists(kept["file_path"])
+    assert not os.path.exists(lost["file_path"])
+    assert restarted.stats()["blobs"] == 1
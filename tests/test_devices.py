@@ -0,0 +1,59 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+@pytest.fixture(scope="module")
+def client():
+    # One lifespan (and event loop) for the module: the app's background
+    # workers are created once per process
+    with TestClient(app) as client:
+        yield client
+
+
+def _register(client: TestClient, email: str) -> dict:
+    response = client.post(
+        "/api/v1/auth/register",
+        json={"email": email, "password": "correct horse", "device_name": "phone"},
+    )
+    assert response.status_code == 201
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_heartbeat_keeps_device_list_etag(client):
+    auth = _register(client, "etag@example.com")
+    with client.websocket_connect("/api/v1/ws") as ws:
+        ws.send_json({
+            "device_id": "dev_desktop_etag",
+            "device_type": "desktop",
+            "token": auth["Authorization"].split(" ")[1],
+        })
+        assert ws.receive_json()["type"] == "connection_ack"
+
+        first = client.get("/api/v1/devices", headers=auth)
+        assert first.status_code == 200
+        assert "dev_desktop_etag" in [device["device_id"] for device in first.json()]
+
+        ws.send_json({"type": "heartbeat"})
+        assert ws.receive_json()["type"] == "heartbeat_ack"
+
+        second = client.get("/api/v1/devices", headers={**auth, "If-None-Match": first.headers["etag"]})
+        assert second.status_code == 304
+
+
+def test_device_list_etag_changes_with_membership(client):
+    auth = _register(client, "members@example.com")
+    first = client.get("/api/v1/devices", headers=auth)
+
+    with client.websocket_connect("/api/v1/ws") as ws:
+        ws.send_json({
+            "device_id": "dev_desktop_members",
+            "device_type": "desktop",
+            "token": auth["Authorization"].split(" ")[1],
+        })
+        assert ws.receive_json()["type"] == "connection_ack"
+
+    second = client.get("/api/v1/devices", headers={**auth, "If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.headers["etag"] != first.headers["etag"]
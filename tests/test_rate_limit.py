@@ -0,0 +1,50 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.utils.rate_limit import RateLimiter, RateLimitMiddleware, TrustedProxies
+
+
+def _app(trusted: list[str], per_minute: int = 2) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=RateLimiter(per_minute / 60.0, per_minute),
+        trusted_proxies=TrustedProxies(trusted),
+    )
+    return app
+
+
+def test_forwarded_clients_behind_trusted_proxy_get_separate_buckets():
+    # TestClient's peer address is "testclient"; trust everything so XFF is used
+    client = TestClient(_app(["*"]))
+    alice = {"X-Forwarded-For": "203.0.113.10"}
+    bob = {"X-Forwarded-For": "203.0.113.20"}
+
+    assert [client.get("/api/ping", headers=alice).status_code for _ in range(3)] == [200, 200, 429]
+    # Alice is exhausted; Bob arrives through the same proxy with his own bucket
+    assert client.get("/api/ping", headers=bob).status_code == 200
+
+
+def test_forwarded_for_ignored_from_untrusted_peer():
+    client = TestClient(_app(["10.0.0.0/8"]))
+
+    codes = [
+        client.get("/api/ping", headers={"X-Forwarded-For": f"203.0.113.{i}"}).status_code
+        for i in range(3)
+    ]
+    assert codes == [200, 200, 429]
+
+
+def test_resolve_skips_trusted_hops():
+    proxies = TrustedProxies(["10.0.0.0/8"])
+
+    assert proxies.resolve("10.0.0.5", "198.51.100.7, 10.1.2.3") == "198.51.100.7"
+    # A client-supplied left-most entry can't override what the proxy saw
+    assert proxies.resolve("10.0.0.5", "1.2.3.4, 198.51.100.7") == "198.51.100.7"
+    assert proxies.resolve("192.0.2.1", "198.51.100.7") == "192.0.2.1"
+    assert proxies.resolve(None, None) == "unknown"